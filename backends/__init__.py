@@ -0,0 +1,36 @@
+import os
+import threading
+from typing import Optional
+
+from .base import LLMBackend
+
+
+def configured_backend() -> str:
+    """The LLM_BACKEND setting: ``groq`` for the hosted API, ``local`` for a transformers model
+
+    Read on every call, so a value loaded from .env after import still applies.
+    """
+    return os.getenv("LLM_BACKEND", "groq")
+
+
+_local_backend: Optional[LLMBackend] = None
+_local_lock = threading.Lock()
+
+
+def get_llm_backend(api_key: Optional[str], model: str) -> LLMBackend:
+    """The configured backend; ``model`` names the Groq model and is ignored by the local backend"""
+    backend = configured_backend()
+    if backend == "groq":
+        from .groq_backend import GroqBackend
+        return GroqBackend(api_key, model)
+    if backend == "local":
+        global _local_backend
+        with _local_lock:
+            if _local_backend is None:
+                from .local import LocalTransformersBackend
+                _local_backend = LocalTransformersBackend()
+            return _local_backend
+    raise ValueError(f"Unknown LLM_BACKEND: {backend!r} (expected 'groq' or 'local')")
+
+
+__all__ = ["LLMBackend", "configured_backend", "get_llm_backend"]
@@ -0,0 +1,26 @@
+from typing import AsyncIterator, Dict, Iterator, List
+
+
+class LLMBackend:
+    """Chat completion backend used by the generator and the fixer
+
+    ``params`` are OpenAI-style sampling parameters (temperature, max_tokens,
+    top_p, stop). Streams yield text deltas and are closed early by calling
+    ``close()`` on the iterator.
+    """
+
+    # Identifies the model in response cache keys
+    model: str = ""
+
+    def stream_chat(self, messages: List[Dict[str, str]], params: Dict) -> Iterator[str]:
+        raise NotImplementedError
+
+    def complete(self, messages: List[Dict[str, str]], params: Dict) -> str:
+        return "".join(self.stream_chat(messages, params))
+
+    async def astream_chat(self, messages: List[Dict[str, str]], params: Dict) -> AsyncIterator[str]:
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    async def acomplete(self, messages: List[Dict[str, str]], params: Dict) -> str:
+        return "".join([delta async for delta in self.astream_chat(messages, params)])
@@ -0,0 +1,71 @@
+from typing import AsyncIterator, Dict, Iterator, List
+
+from .base import LLMBackend
+from utils.groq_client import get_groq_manager
+
+
+class GroqBackend(LLMBackend):
+    """Hosted models through the shared Groq client manager"""
+
+    def __init__(self, api_key: str, model: str):
+        if not api_key:
+            raise ValueError("GROQ_API_KEY not found in .env file")
+        self.api_key = api_key
+        self.model = model
+
+    def stream_chat(self, messages: List[Dict[str, str]], params: Dict) -> Iterator[str]:
+        manager = get_groq_manager()
+        client = manager.client(self.api_key)
+        # The slot is held until the stream is fully read or closed
+        with manager.slot():
+            stream = manager.retry(
+                client.chat.completions.create,
+                model=self.model,
+                messages=messages,
+                stream=True,
+                **params,
+            )
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            finally:
+                stream.close()
+
+    def complete(self, messages: List[Dict[str, str]], params: Dict) -> str:
+        response = get_groq_manager().create_completion(
+            self.api_key,
+            model=self.model,
+            messages=messages,
+            **params,
+        )
+        return response.choices[0].message.content
+
+    async def astream_chat(self, messages: List[Dict[str, str]], params: Dict) -> AsyncIterator[str]:
+        manager = get_groq_manager()
+        client = manager.async_client(self.api_key)
+        async with manager.async_slot():
+            stream = await manager.retry_async(
+                client.chat.completions.create,
+                model=self.model,
+                messages=messages,
+                stream=True,
+                **params,
+            )
+            try:
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            finally:
+                await stream.close()
+
+    async def acomplete(self, messages: List[Dict[str, str]], params: Dict) -> str:
+        response = await get_groq_manager().create_completion_async(
+            self.api_key,
+            model=self.model,
+            messages=messages,
+            **params,
+        )
+        return response.choices[0].message.content
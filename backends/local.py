@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from .base import LLMBackend
+from utils.logging import log, record
+
+# Model directory (as laid out by _downloaders/downModel.py) or Hugging Face model id
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "./models/infly--OpenCoder-8B-Instruct/original")
+
+# "int8" applies dynamic int8 quantization to the linear layers when running on CPU
+LOCAL_QUANTIZE = os.getenv("LOCAL_QUANTIZE", "int8")
+
+# Concurrent requests merged into one generate() call, and how long to wait for them to arrive
+LOCAL_MAX_BATCH = int(os.getenv("LOCAL_MAX_BATCH", "4"))
+LOCAL_BATCH_WAIT_MS = int(os.getenv("LOCAL_BATCH_WAIT_MS", "25"))
+
+# CPU threads used by torch, 0 keeps torch's default
+LOCAL_THREADS = int(os.getenv("LOCAL_THREADS", "0"))
+
+
+class _Request:
+    def __init__(self, messages: List[Dict[str, str]], params: Dict):
+        self.messages = messages
+        self.params = params
+        # Text deltas, then None when done or the exception that ended generation
+        self.deltas: "queue.Queue" = queue.Queue()
+        self.cancelled = threading.Event()
+
+
+def _sampling_key(params: Dict) -> str:
+    """Requests are only batched with others that sample the same way"""
+    return json.dumps(
+        {key: params.get(key) for key in ("temperature", "top_p", "stop")},
+        sort_keys=True,
+        default=str,
+    )
+
+
+class LocalTransformersBackend(LLMBackend):
+    """Runs a causal LM with transformers, merging concurrent requests into batched generate() calls
+
+    A single scheduler thread owns the model. Requests queue up for up to
+    ``batch_wait_ms`` and those with the same sampling settings are generated
+    together; each request still receives its own stream of tokens.
+    """
+
+    def __init__(self, model: str = LOCAL_MODEL, quantize: str = LOCAL_QUANTIZE,
+                 max_batch: int = LOCAL_MAX_BATCH, batch_wait_ms: int = LOCAL_BATCH_WAIT_MS):
+        self.model = model
+        self.quantize = quantize
+        self.max_batch = max(1, max_batch)
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self) -> None:
+        """Load the model on first use, so importing the backend stays cheap"""
+        with self._load_lock:
+            if self._loaded:
+                return
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            if LOCAL_THREADS > 0:
+                torch.set_num_threads(LOCAL_THREADS)
+
+            start = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(self.model)
+            # Left padding keeps every prompt in the batch ending at the same position
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+
+            if torch.cuda.is_available():
+                model = AutoModelForCausalLM.from_pretrained(self.model, torch_dtype=torch.float16, device_map="auto")
+            else:
+                model = AutoModelForCausalLM.from_pretrained(self.model, torch_dtype=torch.float32)
+                if self.quantize == "int8":
+                    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            model.eval()
+
+            self._torch = torch
+            self._tokenizer = tokenizer
+            self._model = model
+            eos = model.generation_config.eos_token_id
+            eos_ids = eos if isinstance(eos, list) else [eos]
+            self._eos_ids = {token for token in eos_ids + [tokenizer.eos_token_id] if token is not None}
+            log(f"Loaded local model {self.model} in {time.perf_counter() - start:.1f}s")
+
+            self._thread = threading.Thread(target=self._schedule, name="local-llm", daemon=True)
+            self._thread.start()
+            self._loaded = True
+
+    def _submit(self, messages: List[Dict[str, str]], params: Dict) -> _Request:
+        self._load()
+        request = _Request(messages, params)
+        self._queue.put(request)
+        return request
+
+    def stream_chat(self, messages: List[Dict[str, str]], params: Dict) -> Iterator[str]:
+        request = self._submit(messages, params)
+        try:
+            while True:
+                item = request.deltas.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Closing the stream early frees the request's row in its batch
+            request.cancelled.set()
+
+    async def astream_chat(self, messages: List[Dict[str, str]], params: Dict) -> AsyncIterator[str]:
+        request = await asyncio.to_thread(self._submit, messages, params)
+        try:
+            while True:
+                item = await asyncio.to_thread(request.deltas.get)
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            request.cancelled.set()
+
+    def _schedule(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups: Dict[str, List[_Request]] = {}
+            for request in batch:
+                if not request.cancelled.is_set():
+                    groups.setdefault(_sampling_key(request.params), []).append(request)
+            for group in groups.values():
+                try:
+                    self._generate(group)
+                except Exception as e:
+                    for request in group:
+                        request.deltas.put(e)
+
+    def _generate(self, requests: List[_Request]) -> None:
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        torch = self._torch
+        tokenizer = self._tokenizer
+        prompts = [
+            tokenizer.apply_chat_template(request.messages, tokenize=False, add_generation_prompt=True)
+            for request in requests
+        ]
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+        inputs = {name: tensor.to(self._model.device) for name, tensor in inputs.items()}
+
+        streamer = _BatchStreamer(tokenizer, requests, self._eos_ids)
+
+        class StopWhenDone(StoppingCriteria):
+            """End the whole batch once every row has finished or been abandoned"""
+
+            def __call__(self, input_ids, scores, **kwargs):
+                done = all(streamer.finished[row] or request.cancelled.is_set()
+                           for row, request in enumerate(requests))
+                return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+        params = requests[0].params
+        temperature = params.get("temperature") or 0.0
+        generate_kwargs = {
+            "max_new_tokens": max(request.params.get("max_tokens") or 1024 for request in requests),
+            "pad_token_id": tokenizer.pad_token_id,
+            "streamer": streamer,
+            "stopping_criteria": StoppingCriteriaList([StopWhenDone()]),
+        }
+        if temperature > 0:
+            generate_kwargs.update(do_sample=True, temperature=temperature, top_p=params.get("top_p") or 1.0)
+        else:
+            generate_kwargs["do_sample"] = False
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            self._model.generate(**inputs, **generate_kwargs)
+        streamer.end()
+        record("local_llm_batch_size", len(requests))
+        record("local_llm_batch_seconds", time.perf_counter() - start)
+
+
+class _BatchStreamer:
+    """Splits the tokens generate() produces for a batch into one text stream per request"""
+
+    def __init__(self, tokenizer, requests: List[_Request], eos_ids):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_ids = eos_ids
+        self.tokens: List[List[int]] = [[] for _ in requests]
+        self.sent = [0] * len(requests)
+        self.finished = [False] * len(requests)
+        self._prompt_seen = False
+
+    def put(self, value) -> None:
+        # The first call carries the prompt tokens
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        value = value.reshape(len(self.requests), -1)
+        for row, request in enumerate(self.requests):
+            if self.finished[row]:
+                continue
+            for token in value[row].tolist():
+                if token in self.eos_ids:
+                    self.finished[row] = True
+                    break
+                self.tokens[row].append(token)
+            if not request.cancelled.is_set():
+                self._flush(row)
+
+    def end(self) -> None:
+        for row, request in enumerate(self.requests):
+            self._flush(row, final=True)
+            request.deltas.put(None)
+
+    def _flush(self, row: int, final: bool = False) -> None:
+        text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+        # A trailing replacement character is a multi-byte character still being generated
+        if text.endswith("�") and not final:
+            return
+        delta = text[self.sent[row]:]
+        if delta:
+            self.requests[row].deltas.put(delta)
+            self.sent[row] = len(text)
@@ -0,0 +1,250 @@
+"""Offline end-to-end benchmark
+
+Replays recorded LLM responses from a local stub server through generation,
+verification, fixing and rendering, and reports latency percentiles per stage,
+throughput, cache hit rates and peak memory::
+
+    python -m benchmarks.run --limit 20
+    python -m benchmarks.run --limit 20 --update-baseline
+    python -m benchmarks.run --limit 20 --baseline benchmarks/baseline.json
+
+Exits with status 1 when a stage is slower than the baseline by more than the
+tolerance, and with status 2 when there is no comparable baseline; record one
+on the machine that runs the check with ``--update-baseline``.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DEFAULT_BASELINE = Path("benchmarks/baseline.json")
+DEFAULT_OUTPUT = Path("outputs/benchmarks/latest.json")
+
+PERCENTILES = (50, 95, 99)
+
+# Differences below this are noise, whatever the relative change
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    from executors.sandbox import maxrss_to_bytes
+    return maxrss_to_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _hit_rate(counters: Dict[str, float], name: str) -> Optional[float]:
+    hits = counters.get(f"{name}_hits", 0)
+    misses = counters.get(f"{name}_misses", 0)
+    if not hits + misses:
+        return None
+    return round(hits / (hits + misses), 4)
+
+
+def _run_static(prompt: str, trace, api_key: str) -> None:
+    """Generation, verification and a single fix, for machines without Manim"""
+    from generators.code_generator import generate_manim_code
+    from fixers.code_fixer import fix_code
+    from utils.logging import use_trace
+    from verifiers.ast_verifier import verify_code
+
+    with use_trace(trace):
+        with trace.span("generate"):
+            code = generate_manim_code(prompt, api_key)
+        with trace.span("verify"):
+            verification = verify_code(code)
+        if not verification["is_valid"]:
+            with trace.span("fix"):
+                code = fix_code(code, verification["errors"], api_key)
+            with trace.span("verify"):
+                verification = verify_code(code)
+        if not verification["is_valid"]:
+            raise ValueError(f"Unable to fix code. Errors: {verification['errors']}")
+
+
+def run_benchmark(prompts: List[str], render: bool, quality_flag: str, concurrency: int, passes: int) -> Dict:
+    from main import Prompt2Anim
+    from utils.logging import Trace, get_metrics_registry
+
+    animator = Prompt2Anim()
+    samples: Dict[str, List[float]] = {}
+    failures = 0
+    renders = 0
+
+    def run_one(prompt: str):
+        trace = Trace()
+        start = time.perf_counter()
+        error = None
+        try:
+            if render:
+                animator.run_pipeline(prompt, trace, quality_flag=quality_flag)
+            else:
+                _run_static(prompt, trace, animator.groq_api_key)
+        except Exception as e:
+            error = e
+        timings = trace.stage_timings()
+        timings["total"] = time.perf_counter() - start
+        return timings, error
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(passes):
+            for timings, error in pool.map(run_one, prompts):
+                for stage, seconds in timings.items():
+                    samples.setdefault(stage, []).append(seconds)
+                if error is not None:
+                    failures += 1
+                    print(f"  failed: {type(error).__name__}: {str(error)[:200]}")
+                elif render:
+                    renders += 1
+    wall_seconds = time.perf_counter() - wall_start
+
+    registry = get_metrics_registry()
+    counters = dict(registry.counters)
+    render_rss = registry.summaries.get("render_peak_rss_bytes")
+    return {
+        "requests": len(prompts) * passes,
+        "failures": failures,
+        "render": render,
+        "quality_flag": quality_flag,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "renders_per_minute": round(renders / wall_seconds * 60, 2) if render and wall_seconds else None,
+        "stages": {
+            stage: {
+                "count": len(values),
+                **{f"p{pct}": round(percentile(values, pct), 4) for pct in PERCENTILES},
+            }
+            for stage, values in sorted(samples.items())
+        },
+        "cache_hit_rates": {
+            "response_cache": _hit_rate(counters, "response_cache"),
+            "render_cache": _hit_rate(counters, "render_cache"),
+        },
+        "peak_rss_bytes": {
+            "benchmark_process": _peak_rss_bytes(),
+            "render": int(render_rss[2]) if render_rss else None,
+        },
+        "counters": counters,
+    }
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Stage percentiles that got slower than the baseline by more than ``tolerance``"""
+    regressions = []
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+        for pct in PERCENTILES:
+            key = f"p{pct}"
+            before, after = previous.get(key, 0.0), current[key]
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{stage} {key}: {before:.4f}s -> {after:.4f}s")
+    return regressions
+
+
+def _print_report(report: Dict) -> None:
+    print(f"{report['requests']} requests, {report['failures']} failed, {report['wall_seconds']}s")
+    for stage, stats in report["stages"].items():
+        percentiles = "  ".join(f"p{pct} {stats[f'p{pct}'] * 1000:9.1f}ms" for pct in PERCENTILES)
+        print(f"  {stage:<10} n={stats['count']:<5} {percentiles}")
+    if report["renders_per_minute"] is not None:
+        print(f"  renders/minute: {report['renders_per_minute']}")
+    print(f"  cache hit rates: {report['cache_hit_rates']}")
+    print(f"  peak RSS bytes: {report['peak_rss_bytes']}")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--recordings", type=Path, help="Captured session JSONL to replay (default: the example corpus)")
+    parser.add_argument("--limit", type=int, default=20, help="Number of recorded prompts to run")
+    parser.add_argument("--passes", type=int, default=1, help="Run the prompts this many times; later passes hit the caches")
+    parser.add_argument("--concurrency", type=int, default=1, help="Prompts processed at once")
+    parser.add_argument("--quality", default="-ql", help="Manim quality flag for renders")
+    parser.add_argument("--no-render", action="store_true", help="Skip rendering (implied when Manim isn't installed)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds the stub server waits per response")
+    parser.add_argument("--cache-dir", type=Path, help="Cache directory to use (default: a fresh temporary one)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="Where to write the report")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline report to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run's report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown per percentile")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = _parse_args()
+
+    # Caches and the API endpoint are read from the environment when their
+    # modules are imported, so they are set up before importing the pipeline
+    cache_dir = args.cache_dir or Path(tempfile.mkdtemp(prefix="prompt2anim_bench_"))
+    os.environ["RESPONSE_CACHE_PATH"] = str(cache_dir / "responses.sqlite3")
+    os.environ["RENDER_CACHE_DIR"] = str(cache_dir / "renders")
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+    from benchmarks.stub_server import StubLLMServer, load_recordings
+
+    recordings = load_recordings(args.recordings)
+    prompts = [prompt for prompt, _ in recordings[:args.limit]]
+    if not prompts:
+        print("No recorded prompts to replay", file=sys.stderr)
+        return 2
+
+    render = not args.no_render and importlib.util.find_spec("manim") is not None
+    if not render and not args.no_render:
+        print("Manim is not installed, benchmarking without rendering")
+
+    with StubLLMServer(recordings, latency=args.llm_latency) as server:
+        os.environ["GROQ_BASE_URL"] = server.base_url
+        report = run_benchmark(prompts, render, args.quality, args.concurrency, args.passes)
+        report["stub_requests"] = server.requests
+        report["stub_misses"] = server.misses
+
+    _print_report(report)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    # A check without a baseline would pass no matter how slow the run was
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; record one with --update-baseline", file=sys.stderr)
+        return 2
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("render") != report["render"]:
+        print(f"Baseline at {args.baseline} was recorded with a different render setting; "
+              f"record one for this machine with --update-baseline", file=sys.stderr)
+        return 2
+    regressions = compare_to_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
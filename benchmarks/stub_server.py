@@ -0,0 +1,144 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from generators.retrieval import load_example_corpus
+from utils.response_cache import normalize_prompt
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+# First line of the fixer's request, see fixers/code_fixer.py
+_FIX_PREFIX = "The following Manim code has errors:"
+_FIX_CODE_END = "\n\nErrors detected:"
+
+
+def load_recordings(recordings: Optional[Path] = None) -> List[Tuple[str, str]]:
+    """Recorded (prompt, response) pairs: the example corpus, or a captured JSONL session
+
+    Session files hold one ``{"prompt": ..., "response": ...}`` object per line.
+    """
+    if recordings is None:
+        return load_example_corpus()
+    pairs = []
+    with open(recordings, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                pairs.append((entry["prompt"], entry["response"]))
+    return pairs
+
+
+class StubLLMServer:
+    """Local OpenAI-compatible chat completions endpoint that replays recorded responses
+
+    Generation requests are answered with the recording for the prompt. Fix
+    requests get the recorded fix when there is one and otherwise the code
+    they were sent, unchanged.
+    """
+
+    def __init__(self, recordings: List[Tuple[str, str]], latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.responses: Dict[str, str] = {normalize_prompt(prompt): response for prompt, response in recordings}
+        self.latency = latency
+        self.requests = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def respond(self, messages: List[Dict[str, str]]) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        response = self.responses.get(normalize_prompt(prompt))
+        with self._lock:
+            self.requests += 1
+            if response is None:
+                self.misses += 1
+        if response is not None:
+            return response
+        if prompt.startswith(_FIX_PREFIX):
+            code = prompt[len(_FIX_PREFIX):].split(_FIX_CODE_END, 1)[0]
+            return code.strip("\n")
+        return ""
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                if self.path != COMPLETIONS_PATH:
+                    self._send(404, "application/json", b'{"error": {"message": "not found"}}')
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                content = stub.respond(body.get("messages", []))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if body.get("stream"):
+                    self._send(200, "text/event-stream", _stream_body(body.get("model", ""), content))
+                else:
+                    self._send(200, "application/json", _completion_body(body.get("model", ""), content))
+
+            def _send(self, status: int, content_type: str, payload: bytes) -> None:
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def _completion_body(model: str, content: str) -> bytes:
+    return json.dumps({
+        "id": "stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }).encode("utf-8")
+
+
+def _stream_body(model: str, content: str) -> bytes:
+    """Server-sent events with one chunk per line of the response"""
+    created = int(time.time())
+    events = []
+    for piece in content.splitlines(keepends=True):
+        chunk = {
+            "id": "stub",
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
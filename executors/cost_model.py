@@ -0,0 +1,253 @@
+import os
+import ast
+import math
+from typing import Dict, List, NamedTuple, Optional
+
+# Timeouts are the estimate times a safety factor plus a fixed margin, clamped to this range
+RENDER_TIMEOUT_MIN = int(os.getenv("RENDER_TIMEOUT_MIN", "30"))
+RENDER_TIMEOUT_MAX = int(os.getenv("RENDER_TIMEOUT_MAX", "300"))
+TIMEOUT_SAFETY_FACTOR = 3.0
+TIMEOUT_MARGIN_SECONDS = 20
+
+# Rough costs on one core, calibrate against the render_estimate_ratio metric
+STARTUP_SECONDS = 3.0
+TEX_SECONDS = 1.2
+TEXT_SECONDS = 0.15
+FRAME_SECONDS_480P = 0.02
+SAMPLE_SECONDS = 0.00002
+MOBJECT_SECONDS = 0.002
+THREE_D_FACTOR = 4.0
+
+# Frame rate and pixel count relative to 480p of each Manim quality flag
+QUALITY_SCALES = {
+    "-ql": (15, 1.0),
+    "-qm": (30, 2.67),
+    "-qh": (60, 6.0),
+    "-qp": (60, 10.67),
+    "-qk": (60, 24.0),
+}
+
+# Loop bodies are counted this many times when the iteration count isn't a constant
+UNKNOWN_LOOP_ITERATIONS = 4
+# Manim's defaults for play() and wait()
+DEFAULT_RUN_TIME = 1.0
+DEFAULT_WAIT = 1.0
+
+TEX_CLASSES = {"Tex", "MathTex", "SingleStringMathTex", "Matrix", "IntegerMatrix", "DecimalMatrix",
+               "BulletedList", "Title", "BraceLabel"}
+TEXT_CLASSES = {"Text", "MarkupText", "Paragraph", "Code"}
+THREE_D_CLASSES = {"Surface", "Sphere", "Cube", "Prism", "Cone", "Cylinder", "Torus", "ThreeDAxes"}
+# Sampled over ``t_range``/``x_range``; the default step when none is given
+SAMPLED_CLASSES = {"ParametricFunction": 0.01, "FunctionGraph": 0.01, "ImplicitFunction": 0.01,
+                   "StreamLines": 0.1, "ArrowVectorField": 0.5, "Surface": 0.1}
+
+
+class RenderCost(NamedTuple):
+    """Work a scene will do, read off its source before rendering"""
+
+    animation_seconds: float = 0.0
+    plays: int = 0
+    tex: int = 0
+    texts: int = 0
+    samples: int = 0
+    mobjects: int = 0
+    three_d: bool = False
+
+    def estimate_seconds(self, quality_flag: str = "-ql") -> float:
+        fps, pixels = QUALITY_SCALES.get(quality_flag, QUALITY_SCALES["-ql"])
+        frame_seconds = FRAME_SECONDS_480P * pixels * (THREE_D_FACTOR if self.three_d else 1.0)
+        return (
+            STARTUP_SECONDS
+            + self.tex * TEX_SECONDS
+            + self.texts * TEXT_SECONDS
+            + self.animation_seconds * fps * frame_seconds
+            + self.samples * SAMPLE_SECONDS
+            + self.mobjects * MOBJECT_SECONDS
+        )
+
+    def timeout(self, quality_flag: str = "-ql") -> float:
+        estimate = self.estimate_seconds(quality_flag) * TIMEOUT_SAFETY_FACTOR + TIMEOUT_MARGIN_SECONDS
+        return min(RENDER_TIMEOUT_MAX, max(RENDER_TIMEOUT_MIN, estimate))
+
+    def __add__(self, other: "RenderCost") -> "RenderCost":
+        return RenderCost(
+            animation_seconds=self.animation_seconds + other.animation_seconds,
+            plays=self.plays + other.plays,
+            tex=self.tex + other.tex,
+            texts=self.texts + other.texts,
+            samples=self.samples + other.samples,
+            mobjects=self.mobjects + other.mobjects,
+            three_d=self.three_d or other.three_d,
+        )
+
+    def scaled(self, factor: int) -> "RenderCost":
+        return RenderCost(
+            animation_seconds=self.animation_seconds * factor,
+            plays=self.plays * factor,
+            tex=self.tex * factor,
+            texts=self.texts * factor,
+            samples=self.samples * factor,
+            mobjects=self.mobjects * factor,
+            three_d=self.three_d,
+        )
+
+
+def _number(node: Optional[ast.AST]) -> Optional[float]:
+    """Value of a numeric literal, including negative ones and simple products like 2 * PI"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _number(node.operand)
+        return -value if value is not None else None
+    if isinstance(node, ast.Name) and node.id in ("PI", "TAU"):
+        return 3.141592653589793 * (2 if node.id == "TAU" else 1)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Div, ast.Add, ast.Sub)):
+        left, right = _number(node.left), _number(node.right)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Div):
+            return left / right if right else None
+        return left + right if isinstance(node.op, ast.Add) else left - right
+    return None
+
+
+def _call_name(node: ast.Call) -> str:
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return ""
+
+
+def _keyword(node: ast.Call, name: str) -> Optional[ast.AST]:
+    for keyword in node.keywords:
+        if keyword.arg == name:
+            return keyword.value
+    return None
+
+
+def _iterations(node: ast.For) -> int:
+    """Iteration count of ``for ... in range(...)`` or over a literal sequence"""
+    it = node.iter
+    if isinstance(it, (ast.List, ast.Tuple, ast.Set)):
+        return len(it.elts)
+    if isinstance(it, ast.Call) and _call_name(it) == "range" and it.args:
+        bounds = [_number(arg) for arg in it.args]
+        if None not in bounds:
+            if len(bounds) == 1:
+                bounds = [0.0, *bounds]
+            start, stop = bounds[:2]
+            step = bounds[2] if len(bounds) > 2 else 1.0
+            if step:
+                # Same as len(range(start, stop, step)), which counts a partial last step
+                return max(0, math.ceil((stop - start) / step))
+    return UNKNOWN_LOOP_ITERATIONS
+
+
+def _samples(node: ast.Call, default_step: float) -> int:
+    """Points a sampled mobject evaluates, from its ``t_range``/``x_range`` and ``resolution``"""
+    resolution = _keyword(node, "resolution")
+    if resolution is not None:
+        if isinstance(resolution, ast.Tuple) and len(resolution.elts) == 2:
+            sides = [_number(elt) for elt in resolution.elts]
+            if None not in sides:
+                return int(sides[0] * sides[1])
+        value = _number(resolution)
+        if value is not None:
+            return int(value * value)
+    for name in ("t_range", "x_range", "u_range"):
+        value = _keyword(node, name)
+        if isinstance(value, (ast.List, ast.Tuple)) and len(value.elts) >= 2:
+            bounds = [_number(elt) for elt in value.elts[:3]]
+            if None in bounds[:2]:
+                continue
+            step = bounds[2] if len(bounds) > 2 and bounds[2] else default_step
+            return int(abs(bounds[1] - bounds[0]) / step) + 1
+    return int(1 / default_step) + 1
+
+
+class _CostVisitor:
+    """Sums the cost of a block of statements, multiplying loop bodies by their iteration count"""
+
+    def block(self, statements: List[ast.stmt]) -> RenderCost:
+        cost = RenderCost()
+        for statement in statements:
+            cost = cost + self.statement(statement)
+        return cost
+
+    def statement(self, node: ast.stmt) -> RenderCost:
+        if isinstance(node, (ast.For, ast.AsyncFor)):
+            return self.block(node.body).scaled(_iterations(node)) + self.block(node.orelse)
+        if isinstance(node, ast.While):
+            return self.block(node.body).scaled(UNKNOWN_LOOP_ITERATIONS)
+        if isinstance(node, ast.If):
+            # Assume the costlier branch runs
+            body, orelse = self.block(node.body), self.block(node.orelse)
+            return body if body.estimate_seconds() >= orelse.estimate_seconds() else orelse
+        if isinstance(node, (ast.With, ast.AsyncWith, ast.Try)):
+            cost = self.block(node.body)
+            for handler in getattr(node, "handlers", []):
+                cost = cost + self.block(handler.body)
+            return cost
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return RenderCost()
+        return self.expression(node)
+
+    def expression(self, node: ast.AST) -> RenderCost:
+        cost = RenderCost()
+        for child in ast.walk(node):
+            if not isinstance(child, ast.Call):
+                continue
+            name = _call_name(child)
+            if name == "play":
+                run_time = _number(_keyword(child, "run_time"))
+                cost = cost + RenderCost(animation_seconds=DEFAULT_RUN_TIME if run_time is None else run_time, plays=1)
+            elif name == "wait":
+                duration = _number(child.args[0]) if child.args else _number(_keyword(child, "duration"))
+                cost = cost + RenderCost(animation_seconds=DEFAULT_WAIT if duration is None else duration)
+            elif name in TEX_CLASSES:
+                cost = cost + RenderCost(tex=1, mobjects=1)
+            elif name in TEXT_CLASSES:
+                cost = cost + RenderCost(texts=1, mobjects=1)
+            elif name in SAMPLED_CLASSES or name.startswith("plot"):
+                samples = _samples(child, SAMPLED_CLASSES.get(name, 0.01))
+                cost = cost + RenderCost(samples=samples, mobjects=1, three_d=name in THREE_D_CLASSES)
+            elif name in THREE_D_CLASSES:
+                cost = cost + RenderCost(mobjects=1, three_d=True)
+            elif name[:1].isupper():
+                cost = cost + RenderCost(mobjects=1)
+        return cost
+
+
+def _scene_classes(tree: ast.Module) -> Dict[str, ast.ClassDef]:
+    return {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+
+
+def estimate_cost(tree: ast.Module, scene: str) -> RenderCost:
+    """Estimate the render cost of ``scene`` from the parsed file it is defined in
+
+    Every method of the scene and of its base classes in the same file is
+    counted, since helpers are usually called from construct().
+    """
+    classes = _scene_classes(tree)
+    visitor = _CostVisitor()
+    cost = RenderCost()
+    seen = set()
+    pending = [scene]
+    while pending:
+        name = pending.pop()
+        node = classes.get(name)
+        if node is None or name in seen:
+            continue
+        seen.add(name)
+        for base in node.bases:
+            base_name = base.id if isinstance(base, ast.Name) else getattr(base, "attr", "")
+            if "ThreeD" in base_name:
+                cost = cost._replace(three_d=True)
+            pending.append(base_name)
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                cost = cost + visitor.block(item.body)
+    return cost
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+import importlib.util
+from pathlib import Path
+from typing import List, Optional
+
+from .sandbox import apply_launcher_limits
+
+# Upper bound for a dry run; construct() without frames normally finishes in a second or two
+DRY_RUN_TIMEOUT = int(os.getenv("DRY_RUN_TIMEOUT", "20"))
+
+
+def dry_run_scenes(script_path: str, scenes: List[str]) -> None:
+    """Run each scene's construct() with frame rendering and video encoding switched off
+
+    Animations are skipped rather than played, so mobjects are still built and
+    animated to their end state and bad kwargs or method names raise here,
+    with tracebacks pointing into ``script_path``.
+    """
+    from manim import config, tempconfig
+    from .tex_cache import install as install_tex_cache
+
+    # Tex compiled here is reused by the render that follows
+    install_tex_cache()
+
+    spec = importlib.util.spec_from_file_location(Path(script_path).stem, script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    with tempfile.TemporaryDirectory(prefix="manim_dry_run_") as media_dir:
+        with tempconfig({"media_dir": media_dir, "disable_caching": True}):
+            # Turns off movie writing, last frame saving and the preview window
+            config.dry_run = True
+            for name in scenes:
+                getattr(module, name)(skip_animations=True).render()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point: ``python -m executors.dry_run script.py Scene [Scene ...]``"""
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) < 2:
+        print("usage: python -m executors.dry_run script.py Scene [Scene ...]", file=sys.stderr)
+        return 2
+    apply_launcher_limits()
+    dry_run_scenes(args[0], args[1:])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: callers run without cross-process locks
+    fcntl = None
+
+# How often a waiting caller retries a lock and checks its cancel event
+LOCK_POLL_SECONDS = 0.1
+
+TryLock = Callable[[], Optional[int]]
+
+
+def try_flock(path: Path) -> Optional[int]:
+    """Take an exclusive flock on ``path`` without waiting; the descriptor, or None when it is held"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except OSError:
+        os.close(fd)
+        return None
+
+
+@contextmanager
+def polled_lock(try_lock: TryLock, cancel_event: Optional[threading.Event] = None) -> Iterator[bool]:
+    """Retry ``try_lock`` until it returns a locked descriptor and hold it
+
+    Yields False when ``cancel_event`` is set first. Closing the descriptor
+    drops the lock, as does the process dying.
+    """
+    fd = try_lock()
+    while fd is None:
+        if cancel_event is not None and cancel_event.wait(LOCK_POLL_SECONDS):
+            yield False
+            return
+        if cancel_event is None:
+            time.sleep(LOCK_POLL_SECONDS)
+        fd = try_lock()
+    try:
+        yield True
+    finally:
+        os.close(fd)
+
+
+@asynccontextmanager
+async def async_polled_lock(try_lock: TryLock) -> AsyncIterator[None]:
+    """Async variant of polled_lock that waits without blocking the event loop"""
+    fd = try_lock()
+    while fd is None:
+        await asyncio.sleep(LOCK_POLL_SECONDS)
+        fd = try_lock()
+    try:
+        yield
+    finally:
+        os.close(fd)
@@ -1,108 +1,666 @@
 import os
 import sys
+import asyncio
+import contextvars
+import threading
 import uuid
+import shutil
 import platform
+import sqlite3
 import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .cost_model import TIMEOUT_SAFETY_FACTOR, RenderCost, estimate_cost
+from .render_cache import canonical_code_hash, get_render_cache, scene_tree
+from .sandbox import DEFAULT_LIMITS, SANDBOX_ENV_FLAG, ExecutionResult, async_render_slot, detect_limit, maxrss_to_bytes, reap_child, render_slot
+from .storage import get_storage_manager
+from .dry_run import DRY_RUN_TIMEOUT
+from .locks import LOCK_POLL_SECONDS
+from .progress import ProgressParser, RenderProgress
+from .scheduler import RENDER_CAPACITY, get_render_scheduler
+from .tex_cache import config_file as tex_cache_config
+from .segment_cache import async_segment_lock, module_name, reused_segments, segment_lock
+from .worker_pool import DRY_RUN, RENDER, get_worker_pool
+from utils.logging import incr, log, record
+from verifiers.ast_verifier import find_scene_classes, verify_code
 
 OUTPUT_DIR = Path("outputs/videos")
 TEMP_DIR = Path("outputs/temp")
+# Fallback timeout; renders normally get one from their cost estimate
+RENDER_TIMEOUT = 120
+
+# A render that prints nothing, not even a progress update, for this long is killed as stuck
+RENDER_STALL_SECONDS = int(os.getenv("RENDER_STALL_SECONDS", "45"))
+
+# ManimRenderError.limit for renders killed by their own watchdogs rather than a sandbox limit
+TIMEOUT = "timeout"
+STALL = "stall"
+
+# Scenes of one file rendered at the same time; more than the process's render turns would only wait
+RENDER_PARALLELISM = int(os.getenv("RENDER_PARALLELISM", str(RENDER_CAPACITY)))
+
+# Execute construct() without writing frames before paying for a full render
+DRY_RUN_ENABLED = os.getenv("DRY_RUN", "1") != "0"
+
+ProgressCallback = Callable[[RenderProgress], None]
+
+class RenderCancelledError(RuntimeError):
+    """Raised when a render is cancelled through its cancel event"""
+
+class ManimRenderError(RuntimeError):
+    """Manim exited with an error; keeps the output so the code can be repaired"""
+    
+    def __init__(self, message: str, scene: str, script_name: str, result: ExecutionResult, limit: str = ""):
+        super().__init__(message)
+        self.scene = scene
+        self.script_name = script_name
+        self.returncode = result.returncode
+        self.stdout = result.stdout
+        self.stderr = result.stderr
+        # Set when the render was stopped by a sandbox limit, its timeout or a stall rather than an exception in the code
+        self.limit = limit or result.limit
+    
+    @property
+    def output(self) -> str:
+        return f"{self.stdout}\n{self.stderr}"
+
+class SceneRenderResult(NamedTuple):
+    video_path: str
+    scene_videos: Dict[str, str]
+
+class _RenderPlan(NamedTuple):
+    file_id: str
+    temp_file: Path
+    quality_flag: str
+    combined_key: str
+    scenes: List[str]
+    scene_keys: Dict[str, str]
+    cached: Dict[str, str]
+    jobs: Dict[str, List[str]]
+    # Estimated render seconds and the timeout derived from them, per scene to render
+    estimates: Dict[str, float]
+    timeouts: Dict[str, float]
+    dry_run_estimate: float
+
+def execute_manim_code(code: str, quality_flag: str = "-ql", use_cache: bool = True,
+                       verification: Optional[Dict] = None,
+                       cancel_event: Optional[threading.Event] = None,
+                       dry_run: bool = DRY_RUN_ENABLED,
+                       on_progress: Optional[ProgressCallback] = None) -> Optional[str]:
+    """Execute Manim code using the virtual environment's Python and return path to video
+    
+    Pass the ``verify_code`` result for ``code`` to reuse its parse tree and scene list.
+    Files with several scenes are rendered in parallel and joined into one video.
+    Setting ``cancel_event`` stops the render with a RenderCancelledError.
+    With ``dry_run`` the scenes are executed without frames first, so runtime
+    errors raise ManimRenderError within seconds instead of after encoding.
+    ``on_progress`` receives a RenderProgress for every progress update of every scene.
+    """
+    return render_scenes(code, quality_flag, use_cache, verification, cancel_event, dry_run, on_progress).video_path
 
-def execute_manim_code(code: str) -> Optional[str]:
-    """Execute Manim code using the virtual environment's Python and return path to video"""
+def render_scenes(code: str, quality_flag: str = "-ql", use_cache: bool = True,
+                  verification: Optional[Dict] = None,
+                  cancel_event: Optional[threading.Event] = None,
+                  dry_run: bool = DRY_RUN_ENABLED,
+                  on_progress: Optional[ProgressCallback] = None) -> SceneRenderResult:
+    """Render every Scene in the code concurrently; returns the joined video and each scene's video"""
+    cached_result, plan = _prepare_render(code, quality_flag, use_cache, verification)
+    if cached_result:
+        return cached_result
+    
+    try:
+        if dry_run:
+            _check_dry_run(plan, _timed_dry_run(plan, cancel_event))
+        
+        # One failed scene fails the file, so the first failure stops the others
+        stop_event = threading.Event()
+        workers = max(1, min(len(plan.jobs), RENDER_PARALLELISM))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Each job gets a copy of the context so metrics land on the caller's trace
+            futures = {
+                scene: pool.submit(contextvars.copy_context().run, _render_scene, plan, scene, stop_event,
+                                   _scene_progress(scene, on_progress))
+                for scene in plan.jobs
+            }
+            pending = set(futures.values())
+            while pending:
+                done, pending = wait(pending, timeout=LOCK_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                if any(_scene_failed(future) for future in done) or (cancel_event is not None and cancel_event.is_set()):
+                    stop_event.set()
+            results = {scene: future.result() for scene, future in futures.items()}
+        result = _finish_render(plan, results, use_cache)
+    except Exception as e:
+        # Clean up temporary files
+        shutil.rmtree(plan.temp_file.parent, ignore_errors=True)
+        raise e
+    _cleanup_render(plan, result)
+    return result
+
+async def execute_manim_code_async(code: str, quality_flag: str = "-ql", use_cache: bool = True,
+                                   verification: Optional[Dict] = None,
+                                   dry_run: bool = DRY_RUN_ENABLED,
+                                   on_progress: Optional[ProgressCallback] = None) -> Optional[str]:
+    """Async variant of execute_manim_code that renders without blocking the event loop"""
+    cached_result, plan = _prepare_render(code, quality_flag, use_cache, verification)
+    if cached_result:
+        return cached_result.video_path
+    
+    try:
+        if dry_run:
+            _check_dry_run(plan, await _timed_dry_run_async(plan))
+        
+        stop_event = threading.Event()
+        tasks = {
+            scene: asyncio.ensure_future(
+                _render_scene_async(plan, scene, _scene_progress(scene, on_progress), stop_event)
+            )
+            for scene in plan.jobs
+        }
+        try:
+            pending = set(tasks.values())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(_scene_failed(task) for task in done):
+                    stop_event.set()
+        finally:
+            # Cancelling the caller stops the renders as well
+            stop_event.set()
+        result = _finish_render(plan, {scene: task.result() for scene, task in tasks.items()}, use_cache)
+    except Exception as e:
+        shutil.rmtree(plan.temp_file.parent, ignore_errors=True)
+        raise e
+    await asyncio.to_thread(_cleanup_render, plan, result)
+    return result.video_path
+
+def dry_run_code(code: str, verification: Optional[Dict] = None,
+                 cancel_event: Optional[threading.Event] = None) -> None:
+    """Execute every scene without writing frames; raises ManimRenderError like a failed render would
+    
+    Lets callers vet code before committing a render to it.
+    """
+    _, plan = _prepare_render(code, use_cache=False, verification=verification, quality_flag="-ql")
+    try:
+        _check_dry_run(plan, _timed_dry_run(plan, cancel_event))
+    finally:
+        shutil.rmtree(plan.temp_file.parent, ignore_errors=True)
+
+def _prepare_render(code: str, quality_flag: str, use_cache: bool,
+                    verification: Optional[Dict] = None) -> Tuple[Optional[SceneRenderResult], Optional[_RenderPlan]]:
+    """Return a cached result if there is one, otherwise write the code out and plan the renders"""
     # Create output directories if they don't exist
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     TEMP_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Generate a unique filename
+    # Reuse the verifier's parse when we have it
+    if verification is None:
+        verification = verify_code(code)
+    scenes = verification["scenes"]
+    if not scenes:
+        raise ValueError("No valid Scene class found in the generated code")
+    log(f"Found scenes: {', '.join(scenes)}")
+    
+    # Identical code rendered before can be served straight from the cache,
+    # and scenes cached on their own don't need to be rendered again
+    tree = verification["tree"]
+    combined_key = canonical_code_hash(code, ",".join(scenes), quality_flag, tree)
+    # Each scene on its own is keyed on its class and the module-level code only
+    scene_keys = {
+        scene: canonical_code_hash(code, scene, quality_flag, scene_tree(tree, scene, scenes) if tree else None)
+        for scene in scenes
+    }
+    cached: Dict[str, str] = {}
+    if use_cache:
+        cache = get_render_cache()
+        cached_video = cache.get(combined_key)
+        for scene in scenes:
+            scene_video = cached_video if len(scenes) == 1 else cache.get(scene_keys[scene])
+            if scene_video:
+                cached[scene] = scene_video
+        if cached_video:
+            log(f"Render cache hit for {', '.join(scenes)}")
+            incr("render_cache_hits")
+            return SceneRenderResult(video_path=cached_video, scene_videos=cached), None
+        incr("render_cache_misses")
+    
+    # A unique directory, but a module name that stays the same across fix rounds
+    # so Manim finds the partial movies of the previous attempt
     file_id = uuid.uuid4().hex
-    temp_file = TEMP_DIR / f"temp_{file_id}.py"
-    output_file = OUTPUT_DIR / f"animation_{file_id}"
+    temp_file = TEMP_DIR / file_id / f"{module_name(scenes)}.py"
+    temp_file.parent.mkdir()
     
     # Write the code to a temporary file
     with open(temp_file, "w", encoding="utf-8") as f:
         f.write(code)
-        print(f'code written succesufully')
+    log(f"Wrote {temp_file}")
     
-    try:
-        # Extract the scene class name from the code
-        scene_class = extract_scene_class(code)
-        print(f'scene name extracted')
-        if not scene_class:
-            raise ValueError("No valid Scene class found in the generated code")
-        
-        # Get Python executable from the virtual environment
-        python_exec = sys.executable
-        print(f'got python executable')
-        # Build the command to run Manim through Python with PYTHONHASHSEED=0
-        command = [
-            python_exec,
-            "-m", "manim",
+    # Build the Manim arguments; they are the same for warm workers and the CLI
+    jobs = {}
+    estimates: Dict[str, float] = {}
+    timeouts: Dict[str, float] = {}
+    dry_run_cost = RenderCost()
+    for scene in scenes:
+        if scene in cached:
+            continue
+        cost = estimate_cost(tree, scene)
+        estimates[scene] = cost.estimate_seconds(quality_flag)
+        timeouts[scene] = cost.timeout(quality_flag)
+        # A dry run compiles the same Tex and builds the same mobjects, but writes no frames
+        dry_run_cost = dry_run_cost + cost._replace(animation_seconds=0.0)
+        jobs[scene] = [
             str(temp_file),
-            scene_class,
-            "-ql",  # low quality for faster rendering
-            "--output_file", output_file.name,
-            "--media_dir", str(OUTPUT_DIR)
+            scene,
+            quality_flag,  # -ql by default for faster rendering
+            "--output_file", _scene_output_name(file_id, scene, scenes),
+            "--media_dir", str(OUTPUT_DIR),
+            # Tex and Text SVGs go to the cache shared by all renders
+            "--config_file", str(tex_cache_config())
         ]
-        
-        # Set up environment variables
-        env = os.environ.copy()
-        env["PYTHONHASHSEED"] = "0"  # Disable hash randomization
-        
-        # Run the command
+    plan = _RenderPlan(
+        file_id=file_id,
+        temp_file=temp_file,
+        quality_flag=quality_flag,
+        combined_key=combined_key,
+        scenes=scenes,
+        scene_keys=scene_keys,
+        cached=cached,
+        jobs=jobs,
+        estimates=estimates,
+        timeouts=timeouts,
+        dry_run_estimate=dry_run_cost.estimate_seconds(quality_flag)
+    )
+    return None, plan
+
+def _scene_output_name(file_id: str, scene: str, scenes: List[str]) -> str:
+    if len(scenes) == 1:
+        return f"animation_{file_id}"
+    return f"animation_{file_id}_{scene}"
+
+def _scene_progress(scene: str, on_progress: Optional[ProgressCallback]) -> Optional[ProgressCallback]:
+    """Tag progress with its scene; a failing callback must not take the render down with it"""
+    if on_progress is None:
+        return None
+    
+    def report(progress: RenderProgress) -> None:
+        try:
+            on_progress(progress._replace(scene=scene))
+        except Exception as e:
+            log(f"Progress callback failed: {e}")
+    return report
+
+def _scene_failed(future) -> bool:
+    """A finished scene render that raised or whose result _check_result would reject"""
+    if future.cancelled() or future.exception() is not None:
+        return True
+    result = future.result()
+    return result.returncode != 0 or result.timed_out or result.cancelled or bool(result.limit)
+
+def _render_scene(plan: _RenderPlan, scene: str, cancel_event: Optional[threading.Event] = None,
+                  on_progress: Optional[ProgressCallback] = None) -> ExecutionResult:
+    """Render one scene of the plan while holding its partial movie directory"""
+    with segment_lock(plan.temp_file.stem, plan.quality_flag, scene, cancel_event) as locked:
+        if not locked:
+            return ExecutionResult(returncode=-1, stdout="", stderr=f"Rendering of {scene} was cancelled", cancelled=True)
+        return _timed_run(plan.jobs[scene], plan.timeouts[scene], plan.estimates[scene], cancel_event, on_progress)
+
+async def _render_scene_async(plan: _RenderPlan, scene: str, on_progress: Optional[ProgressCallback] = None,
+                              cancel_event: Optional[threading.Event] = None) -> ExecutionResult:
+    async with async_segment_lock(plan.temp_file.stem, plan.quality_flag, scene):
+        return await _timed_run_async(plan.jobs[scene], plan.timeouts[scene], plan.estimates[scene], on_progress,
+                                      cancel_event)
+
+def _timed_run(args: List[str], timeout: float = RENDER_TIMEOUT, estimate: float = 0.0,
+               cancel_event: Optional[threading.Event] = None,
+               on_progress: Optional[ProgressCallback] = None) -> ExecutionResult:
+    record("render_estimated_seconds", estimate)
+    start = time.perf_counter()
+    result = _run_manim(args, timeout=timeout, cancel_event=cancel_event, on_progress=on_progress, estimate=estimate)
+    _record_render_metrics(result, time.perf_counter() - start)
+    return result
+
+async def _timed_run_async(args: List[str], timeout: float = RENDER_TIMEOUT, estimate: float = 0.0,
+                           on_progress: Optional[ProgressCallback] = None,
+                           cancel_event: Optional[threading.Event] = None) -> ExecutionResult:
+    record("render_estimated_seconds", estimate)
+    start = time.perf_counter()
+    result = await _run_manim_async(args, timeout=timeout, on_progress=on_progress, estimate=estimate,
+                                    cancel_event=cancel_event)
+    _record_render_metrics(result, time.perf_counter() - start)
+    return result
+
+def _dry_run_args(plan: _RenderPlan) -> List[str]:
+    return [str(plan.temp_file), *plan.jobs]
+
+def _dry_run_timeout(plan: _RenderPlan) -> float:
+    return DRY_RUN_TIMEOUT + plan.dry_run_estimate * TIMEOUT_SAFETY_FACTOR
+
+def _timed_dry_run(plan: _RenderPlan, cancel_event: Optional[threading.Event] = None) -> ExecutionResult:
+    start = time.perf_counter()
+    result = _run_manim(_dry_run_args(plan), timeout=_dry_run_timeout(plan), cancel_event=cancel_event,
+                        mode=DRY_RUN, estimate=plan.dry_run_estimate)
+    record("dry_run_seconds", time.perf_counter() - start)
+    return result
+
+async def _timed_dry_run_async(plan: _RenderPlan) -> ExecutionResult:
+    start = time.perf_counter()
+    result = await _run_manim_async(_dry_run_args(plan), timeout=_dry_run_timeout(plan), mode=DRY_RUN,
+                                    estimate=plan.dry_run_estimate)
+    record("dry_run_seconds", time.perf_counter() - start)
+    return result
+
+def _check_dry_run(plan: _RenderPlan, result: ExecutionResult) -> None:
+    """Raise before the full render when executing the scenes failed"""
+    if result.returncode != 0 and not result.cancelled:
+        incr("dry_run_failures")
+    _check_result(", ".join(plan.jobs), result, plan.temp_file.name, _dry_run_timeout(plan), plan.dry_run_estimate)
+
+def _record_render_metrics(result: ExecutionResult, wall_seconds: float) -> None:
+    record("render_wall_seconds", wall_seconds)
+    reused = reused_segments(result.stdout) + reused_segments(result.stderr)
+    if reused:
+        incr("render_segments_reused", reused)
+    if result.peak_rss_bytes:
+        record("render_peak_rss_bytes", result.peak_rss_bytes)
+
+def _check_result(scene: str, result: ExecutionResult, script_name: str, timeout: float = RENDER_TIMEOUT,
+                  estimate: float = 0.0) -> None:
+    if result.cancelled:
+        raise RenderCancelledError(f"Rendering of {scene} was cancelled")
+    
+    # Runaway scenes go back to the repair loop like any other failure
+    expected = f" (estimated {estimate:.0f} seconds)" if estimate else ""
+    if result.stalled:
+        incr("render_stalls")
+        error_msg = f"Manim rendering of {scene}{expected} made no progress for {RENDER_STALL_SECONDS} seconds"
+        raise ManimRenderError(error_msg, scene, script_name, result, limit=STALL)
+    
+    if result.timed_out:
+        error_msg = f"Manim rendering of {scene}{expected} exceeded its time limit of {timeout:.0f} seconds"
+        raise ManimRenderError(error_msg, scene, script_name, result, limit=TIMEOUT)
+    
+    if result.limit:
+        incr(f"sandbox_{result.limit}_limit_hits")
+        error_msg = f"Manim rendering of {scene} exceeded the sandbox {DEFAULT_LIMITS.describe(result.limit)}"
+        raise ManimRenderError(error_msg, scene, script_name, result)
+    
+    if result.returncode != 0:
+        error_msg = f"Manim execution of {scene} failed (code {result.returncode}):\n"
+        error_msg += f"STDOUT:\n{result.stdout}\n"
+        error_msg += f"STDERR:\n{result.stderr}"
+        raise ManimRenderError(error_msg, scene, script_name, result)
+
+def _finish_render(plan: _RenderPlan, results: Dict[str, ExecutionResult], use_cache: bool) -> SceneRenderResult:
+    """Collect the videos of a finished render, joining multiple scenes, and raise on failure"""
+    # Scenes stopped because a sibling failed come last, so the sibling's error is the one raised
+    for scene, result in sorted(results.items(), key=lambda item: item[1].cancelled):
+        _check_result(scene, result, plan.temp_file.name, plan.timeouts[scene], plan.estimates[scene])
+    
+    # Find the actual output files, in scene order
+    scene_videos: Dict[str, str] = {}
+    module_dir = OUTPUT_DIR / "videos" / plan.temp_file.stem
+    for scene in plan.scenes:
+        if scene in plan.cached:
+            scene_videos[scene] = plan.cached[scene]
+            continue
+        output_file = OUTPUT_DIR / _scene_output_name(plan.file_id, scene, plan.scenes)
+        actual_output = find_output_file(output_file, module_dir)
+        if not actual_output:
+            raise FileNotFoundError(f"Animation file was not generated. Searched for {output_file.stem}*.mp4")
+        scene_videos[scene] = str(actual_output)
+        if use_cache and len(plan.scenes) > 1:
+            get_render_cache().put(plan.scene_keys[scene], str(actual_output))
+    
+    if len(plan.scenes) == 1:
+        video_path = scene_videos[plan.scenes[0]]
+    else:
+        combined = OUTPUT_DIR / f"animation_{plan.file_id}.mp4"
+        video_path = str(concat_videos([scene_videos[scene] for scene in plan.scenes], combined))
+    
+    if use_cache:
+        get_render_cache().put(plan.combined_key, video_path)
+    
+    return SceneRenderResult(video_path=video_path, scene_videos=scene_videos)
+
+def _cleanup_render(plan: _RenderPlan, result: SceneRenderResult) -> None:
+    """Delete the script of a successful render, then track the videos
+    
+    Partial movies stay for the next render of the same scenes; storage
+    quotas evict the ones that go unused.
+    """
+    storage = get_storage_manager()
+    module_dir = OUTPUT_DIR / "videos" / plan.temp_file.stem
+    segments = [
+        segment
+        for scene in plan.jobs
+        for segment in module_dir.glob(f"*/partial_movie_files/{scene}/*.mp4")
+    ]
+    try:
+        storage.remove([plan.temp_file.parent])
+        storage.touch(*segments)
+        for video in {result.video_path, *result.scene_videos.values()}:
+            # Videos served from the render cache are the cache's to manage
+            if OUTPUT_DIR in Path(video).parents:
+                storage.register(video)
+        storage.maybe_enforce()
+    except (OSError, sqlite3.Error) as e:
+        # Housekeeping must not fail a render that succeeded
+        log(f"Storage cleanup failed: {e}")
+
+def concat_videos(videos: List[str], output: Path) -> Path:
+    """Join videos with identical encoding settings using ffmpeg's concat demuxer, without re-encoding"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg is required to join multiple scenes but was not found on PATH")
+    
+    list_file = output.with_suffix(".txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for video in videos:
+            escaped = str(Path(video).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    
+    try:
         result = subprocess.run(
-            command,
-            env=env,
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", str(list_file), "-c", "copy", str(output)],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            timeout=120
+            timeout=RENDER_TIMEOUT
         )
-        
-        if result.returncode != 0:
-            error_msg = f"Manim execution failed (code {result.returncode}):\n"
-            error_msg += f"STDOUT:\n{result.stdout}\n"
-            error_msg += f"STDERR:\n{result.stderr}"
-            raise RuntimeError(error_msg)
-        
-        # Find the actual output file
-        actual_output = find_output_file(output_file)
-        if not actual_output:
-            raise FileNotFoundError(f"Animation file was not generated. Searched for {output_file.stem}*.mp4")
-        
-        return str(actual_output)
-    
-    except subprocess.TimeoutExpired:
-        raise RuntimeError("Manim rendering timed out after 120 seconds")
-    except Exception as e:
-        # Clean up temporary files
-        if temp_file.exists():
-            temp_file.unlink()
-        raise e
     finally:
-        # Clean up any temporary files
-        pass
+        list_file.unlink()
+    if result.returncode != 0:
+        raise RuntimeError(f"Joining scene videos failed:\n{result.stderr}")
+    return output
+
+def _run_manim(args: List[str], timeout: float,
+               cancel_event: Optional[threading.Event] = None, mode: str = RENDER,
+               on_progress: Optional[ProgressCallback] = None, estimate: float = 0.0) -> ExecutionResult:
+    """Run Manim on a warm worker when the pool is enabled, otherwise in a fresh interpreter
+    
+    Either way the render runs under the sandbox limits, once a machine-wide render slot is free.
+    Waiting renders of this process start shortest ``estimate`` first.
+    """
+    start = time.perf_counter()
+    cancelled = ExecutionResult(returncode=-1, stdout="", stderr="Cancelled while waiting for a render slot",
+                                cancelled=True)
+    pool = get_worker_pool()
+    with get_render_scheduler().turn(estimate, cancel_event) as granted:
+        if not granted:
+            return cancelled
+        # Take the warm worker before the machine-wide slot, so no slot is held while waiting for a worker
+        with (pool.checkout(cancel_event) if pool is not None else nullcontext()) as worker:
+            if pool is not None and worker is None:
+                return cancelled
+            with render_slot(cancel_event) as acquired:
+                record("render_slot_wait_seconds", time.perf_counter() - start)
+                if not acquired:
+                    return cancelled
+                render_start = time.perf_counter()
+                result = _run_manim_in_slot(args, timeout, cancel_event, mode, on_progress, worker)
+    _record_estimate_accuracy(mode, estimate, result, time.perf_counter() - render_start)
+    return result
+
+def _run_manim_in_slot(args: List[str], timeout: float,
+                       cancel_event: Optional[threading.Event] = None, mode: str = RENDER,
+                       on_progress: Optional[ProgressCallback] = None, worker=None) -> ExecutionResult:
+    """Render on ``worker`` when one was checked out of the pool, otherwise in a fresh interpreter"""
+    stall_timeout = RENDER_STALL_SECONDS if mode == RENDER else 0
+    if worker is not None:
+        return get_worker_pool().run(worker, args, timeout, cancel_event, mode, on_progress, stall_timeout,
+                                     DEFAULT_LIMITS)
+    
+    # Get Python executable from the virtual environment
+    command = [sys.executable, "-m", *_entry_command(mode), *args]
+    
+    # Set up environment variables
+    env = os.environ.copy()
+    env["PYTHONHASHSEED"] = "0"  # Disable hash randomization
+    env[SANDBOX_ENV_FLAG] = "1"  # The launcher applies the sandbox limits before importing Manim
+    
+    process = subprocess.Popen(
+        command,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    # Read both pipes as the output arrives; Manim's progress bars go to stderr
+    output = _OutputReader(process, on_progress)
+    deadline = time.monotonic() + timeout
+    while True:
+        usage = _wait(process, 0.2)
+        if usage is not None:
+            break
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        timed_out = time.monotonic() > deadline
+        stalled = bool(stall_timeout) and output.idle_seconds() > stall_timeout
+        if cancelled or timed_out or stalled:
+            process.kill()
+            process.wait()
+            stdout, stderr = output.join()
+            return ExecutionResult(
+                returncode=-1,
+                stdout=stdout,
+                stderr=stderr,
+                timed_out=timed_out or stalled,
+                cancelled=cancelled,
+                stalled=stalled
+            )
+    stdout, stderr = output.join()
+    return ExecutionResult(
+        returncode=process.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        peak_rss_bytes=maxrss_to_bytes(usage.ru_maxrss) if usage else 0,
+        limit=detect_limit(process.returncode, stderr, usage.ru_utime + usage.ru_stime if usage else 0)
+    )
+
+def _wait(process: subprocess.Popen, timeout: float):
+    """Wait up to ``timeout`` for the process to exit
+
+    Returns the process's own resource usage once it has exited, False where
+    os.wait4 is unavailable, and None while it is still running.
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            process.wait(timeout=timeout)
+            return False
+        except subprocess.TimeoutExpired:
+            return None
+    deadline = time.monotonic() + timeout
+    while True:
+        reaped = reap_child(process.pid, block=False)
+        if reaped is not None:
+            # Reaped behind Popen's back, so tell it the exit code
+            process.returncode, usage = reaped
+            return usage
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.05)
+
+class _OutputReader:
+    """Drains a process's stdout and stderr on background threads, parsing progress from stderr"""
+    
+    def __init__(self, process: subprocess.Popen, on_progress: Optional[ProgressCallback] = None):
+        self._chunks: Dict[str, List[bytes]] = {"stdout": [], "stderr": []}
+        self._parser = ProgressParser()
+        self._on_progress = on_progress
+        self._last_output = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._drain, args=(process.stdout, "stdout"), daemon=True),
+            threading.Thread(target=self._drain, args=(process.stderr, "stderr"), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def _drain(self, pipe, name: str) -> None:
+        with pipe:
+            for chunk in iter(lambda: pipe.read1(65536), b""):
+                self._last_output = time.monotonic()
+                self._chunks[name].append(chunk)
+                if name == "stderr" and self._on_progress is not None:
+                    for progress in self._parser.feed(chunk.decode("utf-8", errors="replace")):
+                        self._on_progress(progress)
+    
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self._last_output
+    
+    def join(self) -> Tuple[str, str]:
+        for thread in self._threads:
+            thread.join()
+        return _decode(b"".join(self._chunks["stdout"])), _decode(b"".join(self._chunks["stderr"]))
+
+async def _run_manim_async(args: List[str], timeout: float, mode: str = RENDER,
+                           on_progress: Optional[ProgressCallback] = None, estimate: float = 0.0,
+                           cancel_event: Optional[threading.Event] = None) -> ExecutionResult:
+    """Run Manim without blocking the event loop; setting ``cancel_event`` stops the render once it started"""
+    start = time.perf_counter()
+    pool = get_worker_pool()
+    async with get_render_scheduler().async_turn(estimate), \
+            (pool.async_checkout() if pool is not None else nullcontext()) as worker, \
+            async_render_slot():
+        record("render_slot_wait_seconds", time.perf_counter() - start)
+        render_start = time.perf_counter()
+        result = await _run_manim_in_slot_async(args, timeout, mode, on_progress, worker, cancel_event)
+    _record_estimate_accuracy(mode, estimate, result, time.perf_counter() - render_start)
+    return result
+
+def _record_estimate_accuracy(mode: str, estimate: float, result: ExecutionResult, seconds: float) -> None:
+    """Actual over estimated render time, for calibrating the cost model"""
+    if mode == RENDER and estimate and result.returncode == 0:
+        record("render_estimate_ratio", seconds / estimate)
+
+async def _run_manim_in_slot_async(args: List[str], timeout: float, mode: str = RENDER,
+                                   on_progress: Optional[ProgressCallback] = None, worker=None,
+                                   cancel_event: Optional[threading.Event] = None) -> ExecutionResult:
+    # A thread rather than an asyncio subprocess: the event loop's child watcher
+    # would reap the process before os.wait4 could read its own peak memory
+    return await asyncio.to_thread(_run_manim_in_slot, args, timeout, cancel_event, mode, on_progress, worker)
+
+def _entry_command(mode: str) -> List[str]:
+    """Module and arguments that start a render; the launcher installs the shared Tex cache first"""
+    return ["executors.dry_run"] if mode == DRY_RUN else ["executors.tex_cache", "render"]
+
+def _decode(output) -> str:
+    if isinstance(output, bytes):
+        return output.decode("utf-8", errors="replace")
+    return output or ""
 
 def extract_scene_class(code: str) -> Optional[str]:
     """Extract the first Scene class name from the code"""
-    try:
-        lines = code.split('\n')
-        for line in lines:
-            line = line.strip()
-            if line.startswith("class ") and ("(Scene)" in line or "(Scene):" in line):
-                return line.split("class ")[1].split("(")[0].strip()
-        return None
-    except Exception:
-        return None
+    scenes = find_scene_classes(code)
+    return scenes[0] if scenes else None
 
-def find_output_file(base_path: Path) -> Optional[Path]:
+def find_output_file(base_path: Path, search_dir: Optional[Path] = None) -> Optional[Path]:
     """Find the actual output file since Manim might add suffixes"""
-    directory = base_path.parent
+    directory = search_dir if search_dir is not None and search_dir.exists() else base_path.parent
     
-    # Look for files with the same stem but possibly different extensions
-    for pattern in [f"{base_path.stem}*.mp4", f"{base_path.name}*.mp4"]:
-        for file in directory.glob(pattern):
+    # Manim nests videos under videos/<module>/<quality>/, so search recursively
+    for pattern in [f"{base_path.name}.mp4", f"{base_path.stem}*.mp4", f"{base_path.name}*.mp4"]:
+        for file in directory.rglob(pattern):
             return file
     
     return None
\ No newline at end of file
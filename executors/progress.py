@@ -0,0 +1,55 @@
+import re
+from typing import List, NamedTuple, Optional
+
+# Manim's tqdm bar, e.g. `Animation 3: Create(Circle):  45%|████▌     | 27/60 [00:01<00:01, 20.1it/s]`
+_PROGRESS_RE = re.compile(
+    r"Animation (?P<index>\d+)\s*:?\s*(?P<description>.*?):?\s+(?P<percent>\d+)%\|[^|]*\|\s*(?P<frames>\d+)/(?P<total>\d+)"
+)
+# tqdm redraws its line with carriage returns, so both end a progress update
+_LINE_BREAK_RE = re.compile(r"[\r\n]")
+
+
+class RenderProgress(NamedTuple):
+    animation: int
+    percent: float
+    frames: int
+    total_frames: int
+    description: str = ""
+    # Filled in by the executor, which knows which scene the output belongs to
+    scene: str = ""
+
+
+def parse_progress_line(line: str) -> Optional[RenderProgress]:
+    match = _PROGRESS_RE.search(line)
+    if match is None:
+        return None
+    frames = int(match.group("frames"))
+    total = int(match.group("total"))
+    percent = 100.0 * frames / total if total else float(match.group("percent"))
+    return RenderProgress(
+        animation=int(match.group("index")),
+        percent=percent,
+        frames=frames,
+        total_frames=total,
+        description=match.group("description").strip(),
+    )
+
+
+class ProgressParser:
+    """Turns chunks of Manim output into progress events, keeping partial lines between chunks"""
+
+    def __init__(self):
+        self._pending = ""
+        self._last: Optional[RenderProgress] = None
+
+    def feed(self, text: str) -> List[RenderProgress]:
+        parts = _LINE_BREAK_RE.split(self._pending + text)
+        self._pending = parts.pop()
+        events = []
+        for part in parts:
+            progress = parse_progress_line(part)
+            # tqdm often redraws without advancing
+            if progress is not None and progress != self._last:
+                events.append(progress)
+                self._last = progress
+        return events
@@ -0,0 +1,49 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from .manim_executor import execute_manim_code
+
+# Background final-quality renders running at once, across all users of this process
+FINAL_RENDER_WORKERS = int(os.getenv("FINAL_RENDER_WORKERS", "2"))
+
+_final_render_pool = ThreadPoolExecutor(max_workers=FINAL_RENDER_WORKERS, thread_name_prefix="final-render")
+
+
+class BackgroundRender:
+    """A cancellable render of already verified code running in the background"""
+
+    def __init__(self, code: str, quality_flag: str, verification: Optional[Dict] = None):
+        self.quality_flag = quality_flag
+        self._cancel_event = threading.Event()
+        self._future: Future = _final_render_pool.submit(
+            execute_manim_code,
+            code,
+            quality_flag,
+            verification=verification,
+            cancel_event=self._cancel_event,
+            # The preview of the same code already passed its dry run
+            dry_run=False,
+        )
+
+    def cancel(self) -> None:
+        """Drop the job if it hasn't started, otherwise kill its render"""
+        self._cancel_event.set()
+        self._future.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self) -> str:
+        """Path of the final video; raises whatever the render raised"""
+        return self._future.result()
+
+    def error(self) -> Optional[BaseException]:
+        if not self.done() or self._future.cancelled():
+            return None
+        return self._future.exception()
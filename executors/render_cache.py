@@ -0,0 +1,149 @@
+import os
+import ast
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+CACHE_DIR = Path(os.getenv("RENDER_CACHE_DIR", "outputs/cache/renders"))
+MAX_CACHE_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def canonical_code_hash(code: str, scene_class: str, quality_flag: str, tree: Optional[ast.AST] = None) -> str:
+    """Hash the code's AST (ignoring whitespace and comments) together with the render settings"""
+    try:
+        canonical = ast.dump(tree if tree is not None else ast.parse(code))
+    except SyntaxError:
+        # Unparseable code will fail to render anyway, fall back to trimmed source
+        canonical = "\n".join(line.rstrip() for line in code.strip().splitlines())
+
+    digest = hashlib.sha256()
+    for part in (canonical, scene_class, quality_flag):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def scene_tree(tree: ast.Module, scene_class: str, scenes: List[str]) -> ast.Module:
+    """The module without the other scenes, so editing one scene doesn't change another's hash
+
+    Imports, helpers and constants stay, as do scenes ``scene_class`` inherits from.
+    """
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    needed = set()
+    pending = [scene_class]
+    while pending:
+        name = pending.pop()
+        if name in needed or name not in classes:
+            continue
+        needed.add(name)
+        pending.extend(base.id for base in classes[name].bases if isinstance(base, ast.Name))
+    body = [
+        node for node in tree.body
+        if not (isinstance(node, ast.ClassDef) and node.name in scenes and node.name not in needed)
+    ]
+    return ast.Module(body=body, type_ignores=[])
+
+
+class RenderCache:
+    """Size-bounded on-disk cache of rendered videos with LRU eviction
+
+    The index is a SQLite database, so processes sharing the cache directory
+    see each other's entries and evict against one total size.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.index_path = self.cache_dir / "index.sqlite3"
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached video for ``key`` and mark it as recently used"""
+        with self._lock, self._connection() as conn:
+            row = conn.execute("SELECT file FROM renders WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            video = self.cache_dir / row[0]
+            if not video.exists():
+                conn.execute("DELETE FROM renders WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE renders SET last_used = ? WHERE key = ?", (time.time(), key))
+            return str(video)
+
+    def put(self, key: str, video_path: str) -> str:
+        """Store a rendered video under ``key`` and evict old entries over the size limit"""
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            target = self.cache_dir / f"{key}.mp4"
+            staging = self.cache_dir / f".{key}.{os.getpid()}.tmp"
+
+            # Hard link when possible so the cache doesn't double disk usage
+            try:
+                os.link(video_path, staging)
+            except OSError:
+                shutil.copy2(video_path, staging)
+            os.replace(staging, target)
+
+            with self._connection() as conn:
+                # The insert takes SQLite's write lock, so eviction sees every other process's entries
+                conn.execute(
+                    "INSERT OR REPLACE INTO renders (key, file, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, target.name, target.stat().st_size, time.time()),
+                )
+                self._evict(conn)
+            return str(target)
+
+    def total_bytes(self) -> int:
+        with self._lock, self._connection() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, file, size in conn.execute("SELECT key, file, size FROM renders ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append(key)
+            total -= size
+            (self.cache_dir / file).unlink(missing_ok=True)
+        conn.executemany("DELETE FROM renders WHERE key = ?", [(key,) for key in evicted])
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.index_path), timeout=30)
+        try:
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS renders ("
+                    "key TEXT PRIMARY KEY, file TEXT NOT NULL, "
+                    "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+                )
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+_render_cache: Optional[RenderCache] = None
+
+
+def get_render_cache() -> RenderCache:
+    """Return the process-wide render cache"""
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache()
+    return _render_cache
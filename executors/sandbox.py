@@ -1,37 +1,198 @@
-import subprocess
-from typing import NamedTuple
+import os
+import re
+import sys
+import signal
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, NamedTuple, Optional, Tuple
+
+from .locks import async_polled_lock, polled_lock, try_flock
+
+try:
+    import fcntl
+    import resource
+except ImportError:  # Windows: no rlimits or flock, renders run unrestricted
+    fcntl = None
+    resource = None
 
 class ExecutionResult(NamedTuple):
     returncode: int
     stdout: str
     stderr: str
+    timed_out: bool = False
+    peak_rss_bytes: int = 0
+    cancelled: bool = False
+    # Killed for writing no output for too long; timed_out is set as well
+    stalled: bool = False
+    # The sandbox limit the process ran into (MEMORY, CPU, FILE_SIZE or PROCESSES), if any
+    limit: str = ""
+
+
+MEMORY = "memory"
+CPU = "cpu"
+FILE_SIZE = "file_size"
+PROCESSES = "processes"
+
+# Renders allowed to run at once on this machine, across every process of the app
+SANDBOX_MAX_RENDERS = int(os.getenv("SANDBOX_MAX_RENDERS", str(os.cpu_count() or 1)))
+SANDBOX_SLOT_DIR = Path(os.getenv("SANDBOX_SLOT_DIR", os.path.join(tempfile.gettempdir(), "prompt2anim-render-slots")))
+
+# Seconds between the soft CPU limit's SIGXCPU and the hard limit's SIGKILL
+_CPU_GRACE_SECONDS = 5
+
+_MIB = 1024 ** 2
+
+
+class SandboxLimits(NamedTuple):
+    """Resource limits for one render; 0 disables a limit"""
+
+    # Address space on top of what the process has mapped when the limits are applied
+    memory_bytes: int = 4096 * _MIB
+    cpu_seconds: int = 300
+    # Largest file the render may write
+    file_size_bytes: int = 2048 * _MIB
+    # RLIMIT_NPROC counts every process and thread of the user, not only the render's,
+    # so it is off by default: on a busy machine latex and ffmpeg forks would fail for no visible reason
+    processes: int = 0
+
+    def describe(self, limit: str) -> str:
+        if limit == MEMORY:
+            return f"memory limit of {self.memory_bytes // _MIB} MiB"
+        if limit == CPU:
+            return f"CPU time limit of {self.cpu_seconds} seconds"
+        if limit == FILE_SIZE:
+            return f"file size limit of {self.file_size_bytes // _MIB} MiB"
+        if limit == PROCESSES:
+            return f"process limit of {self.processes}"
+        return f"{limit} limit"
+
+
+DEFAULT_LIMITS = SandboxLimits(
+    memory_bytes=int(os.getenv("SANDBOX_MEMORY_MB", "4096")) * _MIB,
+    cpu_seconds=int(os.getenv("SANDBOX_CPU_SECONDS", "300")),
+    file_size_bytes=int(os.getenv("SANDBOX_FILE_SIZE_MB", "2048")) * _MIB,
+    processes=int(os.getenv("SANDBOX_MAX_PROCESSES", "0")),
+)
+
+# Set in the environment of render subprocesses, whose launcher applies the limits itself:
+# preexec_fn isn't safe in a parent with threads running, and the app always has some
+SANDBOX_ENV_FLAG = "PROMPT2ANIM_SANDBOX"
+
+# Output of a process that failed because of a limit. Python ignores SIGXFSZ,
+# so oversized writes surface as EFBIG instead of the signal.
+_LIMIT_PATTERNS: Dict[str, "re.Pattern[str]"] = {
+    MEMORY: re.compile(r"MemoryError|Unable to allocate|Cannot allocate memory|std::bad_alloc"),
+    FILE_SIZE: re.compile(r"\[Errno 27\]|File too large"),
+    PROCESSES: re.compile(r"can't start new thread|BlockingIOError: \[Errno 11\]|fork: Resource temporarily unavailable"),
+}
 
-def run_in_sandbox(command: str, timeout: int = 30) -> ExecutionResult:
-    """Run a command in a restricted environment"""
+
+def maxrss_to_bytes(maxrss: int) -> int:
+    """ru_maxrss is reported in kilobytes on Linux and in bytes on macOS"""
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def reap_child(pid: int, block: bool = True) -> Optional[Tuple[int, "resource.struct_rusage"]]:
+    """Reap child ``pid`` and return its exit code and the resources it used
+
+    os.wait4 reports the usage of that one child, unlike RUSAGE_CHILDREN, which
+    keeps the maximum over every child ever waited for. Returns None when
+    ``block`` is false and the child is still running.
+    """
+    waited_pid, status, usage = os.wait4(pid, 0 if block else os.WNOHANG)
+    if not waited_pid:
+        return None
+    return os.waitstatus_to_exitcode(status), usage
+
+def mapped_bytes() -> int:
+    """Address space the current process has mapped, 0 where /proc is unavailable"""
     try:
-        result = subprocess.run(
-            command,
-            shell=True,
-            timeout=timeout,
-            capture_output=True,
-            text=True,
-            # Additional security measures
-            env={"PATH": "/usr/bin", "PYTHONPATH": ""},
-        )
-        return ExecutionResult(
-            returncode=result.returncode,
-            stdout=result.stdout,
-            stderr=result.stderr
-        )
-    except subprocess.TimeoutExpired:
-        return ExecutionResult(
-            returncode=-1,
-            stdout="",
-            stderr=f"Command timed out after {timeout} seconds"
-        )
-    except Exception as e:
-        return ExecutionResult(
-            returncode=-1,
-            stdout="",
-            stderr=str(e)
-        )
\ No newline at end of file
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def apply_limits(limits: SandboxLimits = DEFAULT_LIMITS, base_bytes: int = 0) -> None:
+    """Set rlimits on the current process; call it in a forked child before running untrusted code
+
+    ``base_bytes`` is added to the memory budget, so a child forked off a warm
+    worker keeps the interpreter and libraries it inherited.
+    """
+    if resource is None:
+        return
+    if limits.memory_bytes:
+        _set_limit(resource.RLIMIT_AS, base_bytes + limits.memory_bytes)
+    if limits.cpu_seconds:
+        # The soft limit sends SIGXCPU, the hard limit a SIGKILL shortly after
+        _set_limit(resource.RLIMIT_CPU, limits.cpu_seconds, limits.cpu_seconds + _CPU_GRACE_SECONDS)
+    if limits.file_size_bytes:
+        _set_limit(resource.RLIMIT_FSIZE, limits.file_size_bytes)
+    if limits.processes and hasattr(resource, "RLIMIT_NPROC"):
+        _set_limit(resource.RLIMIT_NPROC, limits.processes)
+
+def apply_launcher_limits() -> None:
+    """Apply DEFAULT_LIMITS in a launcher the executor started; call before importing Manim"""
+    if os.environ.pop(SANDBOX_ENV_FLAG, None) == "1":
+        apply_limits(DEFAULT_LIMITS, base_bytes=mapped_bytes())
+
+def _set_limit(kind: int, soft: int, hard: Optional[int] = None) -> None:
+    current_soft, current_hard = resource.getrlimit(kind)
+    hard = soft if hard is None else hard
+    if current_hard != resource.RLIM_INFINITY:
+        # An unprivileged process can lower its limits but never raise them
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    if current_soft != resource.RLIM_INFINITY:
+        soft = min(soft, current_soft)
+    resource.setrlimit(kind, (soft, hard))
+
+def detect_limit(returncode: int, output: str, cpu_used: float = 0,
+                 limits: SandboxLimits = DEFAULT_LIMITS) -> str:
+    """Name the sandbox limit a failed process ran into, or "" when it failed for another reason
+
+    ``cpu_used`` is the process's CPU time, when known, to recognise the hard
+    CPU limit's SIGKILL.
+    """
+    if returncode == 0:
+        return ""
+    if returncode == -getattr(signal, "SIGXCPU", -1):
+        return CPU
+    if returncode == -signal.SIGKILL and limits.cpu_seconds and cpu_used >= limits.cpu_seconds:
+        return CPU
+    if returncode == -getattr(signal, "SIGXFSZ", -1):
+        return FILE_SIZE
+    for limit, pattern in _LIMIT_PATTERNS.items():
+        if pattern.search(output):
+            return limit
+    return ""
+
+
+def _try_acquire_slot() -> Optional[int]:
+    """Lock one free slot file and return its descriptor, or None when all are taken"""
+    for index in range(max(1, SANDBOX_MAX_RENDERS)):
+        fd = try_flock(SANDBOX_SLOT_DIR / f"slot-{index}.lock")
+        if fd is not None:
+            return fd
+    return None
+
+@contextmanager
+def render_slot(cancel_event: Optional[threading.Event] = None) -> Iterator[bool]:
+    """Hold one of the SANDBOX_MAX_RENDERS machine-wide render slots
+
+    Yields False when ``cancel_event`` is set before a slot frees up.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with polled_lock(_try_acquire_slot, cancel_event) as acquired:
+        yield acquired
+
+@asynccontextmanager
+async def async_render_slot() -> AsyncIterator[None]:
+    """Async variant of render_slot that waits without blocking the event loop"""
+    if fcntl is None:
+        yield
+        return
+    async with async_polled_lock(_try_acquire_slot):
+        yield
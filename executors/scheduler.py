@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, List, Optional
+
+from .sandbox import SANDBOX_MAX_RENDERS
+from .worker_pool import warm_worker_count
+
+# Seconds of estimated work a waiting render is credited per second it has waited,
+# so long renders still get their turn under a steady stream of short ones
+RENDER_AGING_RATE = float(os.getenv("RENDER_AGING_RATE", "0.5"))
+
+# Renders of one process running at once. With warm workers enabled there are
+# never more turns than workers, so a render that got its turn doesn't queue again for one.
+RENDER_CAPACITY = min(SANDBOX_MAX_RENDERS, warm_worker_count() or SANDBOX_MAX_RENDERS)
+
+
+class _Waiter:
+    def __init__(self, cost: float, sequence: int):
+        self.cost = cost
+        self.sequence = sequence
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+    def priority(self, now: float) -> float:
+        return self.cost - (now - self.enqueued) * RENDER_AGING_RATE
+
+
+class RenderScheduler:
+    """Hands out render turns shortest estimated job first, with aging
+
+    Holds back renders of this process beyond ``capacity``; the machine-wide
+    sandbox slots are taken after a turn is granted.
+    """
+
+    def __init__(self, capacity: int = RENDER_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._running = 0
+        self._waiting: List[_Waiter] = []
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+
+    @contextmanager
+    def turn(self, cost: float, cancel_event: Optional[threading.Event] = None) -> Iterator[bool]:
+        """Wait for this render's turn; yields False when ``cancel_event`` is set first"""
+        waiter = self._enqueue(cost)
+        granted = self._wait(waiter, cancel_event)
+        try:
+            yield granted
+        finally:
+            if granted:
+                self._release()
+
+    @asynccontextmanager
+    async def async_turn(self, cost: float) -> AsyncIterator[None]:
+        """Async variant of turn that waits without blocking the event loop"""
+        waiter = self._enqueue(cost)
+        try:
+            while not self._try_grant(waiter):
+                await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def waiting(self) -> int:
+        with self._condition:
+            return len(self._waiting)
+
+    def _enqueue(self, cost: float) -> _Waiter:
+        waiter = _Waiter(cost, next(self._sequence))
+        with self._condition:
+            self._waiting.append(waiter)
+            self._grant()
+        return waiter
+
+    def _wait(self, waiter: _Waiter, cancel_event: Optional[threading.Event]) -> bool:
+        with self._condition:
+            while not waiter.granted:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._waiting.remove(waiter)
+                    self._grant()
+                    return False
+                # Wake up now and then: aging changes the order, and cancel events don't notify us
+                self._condition.wait(0.1)
+                self._grant()
+            return True
+
+    def _try_grant(self, waiter: _Waiter) -> bool:
+        with self._condition:
+            self._grant()
+            return waiter.granted
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._condition:
+            if waiter.granted:
+                self._running -= 1
+            else:
+                self._waiting.remove(waiter)
+            self._grant()
+
+    def _release(self) -> None:
+        with self._condition:
+            self._running -= 1
+            self._grant()
+
+    def _grant(self) -> None:
+        """Give free turns to the waiters with the lowest aged cost; call with the condition held"""
+        now = time.monotonic()
+        granted = False
+        while self._running < self.capacity and self._waiting:
+            waiter = min(self._waiting, key=lambda w: (w.priority(now), w.sequence))
+            self._waiting.remove(waiter)
+            waiter.granted = True
+            self._running += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+
+_render_scheduler: Optional[RenderScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_render_scheduler() -> RenderScheduler:
+    """Return the process-wide render scheduler"""
+    global _render_scheduler
+    with _scheduler_lock:
+        if _render_scheduler is None:
+            _render_scheduler = RenderScheduler()
+        return _render_scheduler
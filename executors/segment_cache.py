@@ -0,0 +1,104 @@
+import os
+import re
+import hashlib
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional
+
+from .locks import async_polled_lock, polled_lock, try_flock
+
+try:
+    import fcntl
+except ImportError:  # Windows: renders of the same scene aren't serialized
+    fcntl = None
+
+# Manim caches every play() call as a partial movie under
+# videos/<module>/<quality>/partial_movie_files/<Scene>/<hash>.mp4 and skips
+# encoding calls whose hash already has a file. Scripts are named after their
+# scenes instead of a random id so fix rounds and regenerations of the same
+# scene land in the same directory and reuse the segments that didn't change.
+SEGMENT_LOCK_DIR = Path(os.getenv("SEGMENT_LOCK_DIR", "outputs/cache/segment_locks"))
+
+# Partial movie directories of Manim's quality flags
+QUALITY_DIRS = {
+    "-ql": "480p15",
+    "-qm": "720p30",
+    "-qh": "1080p60",
+    "-qp": "1440p60",
+    "-qk": "2160p60",
+}
+
+# Longest module name built from scene names before falling back to a hash
+_MAX_MODULE_NAME = 64
+_REUSED_RE = re.compile(r"Using cached data")
+
+
+def module_name(scenes: List[str]) -> str:
+    """Stable module name for a script defining ``scenes``"""
+    name = "scene_" + "_".join(scenes)
+    if len(name) > _MAX_MODULE_NAME or not name.isidentifier():
+        digest = hashlib.sha1(",".join(scenes).encode("utf-8")).hexdigest()[:16]
+        name = f"scene_{digest}"
+    return name
+
+
+def reused_segments(output: str) -> int:
+    """Number of play() calls Manim served from cached partial movies"""
+    return len(_REUSED_RE.findall(output))
+
+
+def quality_dir(quality_flag: str) -> str:
+    """Directory Manim puts the partial movies of a quality flag in, e.g. 480p15 for -ql"""
+    return QUALITY_DIRS.get(quality_flag, quality_flag.lstrip("-"))
+
+
+def _lock_path(module: str, quality: str, scene: str) -> Path:
+    return SEGMENT_LOCK_DIR / f"{module}.{quality}.{scene}.lock"
+
+
+@contextmanager
+def segment_lock(module: str, quality_flag: str, scene: str,
+                 cancel_event: Optional[threading.Event] = None) -> Iterator[bool]:
+    """Hold the partial movie directory of ``scene`` at one quality for one render
+
+    Manim writes its list of segments to join into that directory, so two
+    renders of the same scene at the same quality must not overlap; other
+    qualities have directories of their own. Yields False when
+    ``cancel_event`` is set first.
+    """
+    if fcntl is None:
+        yield True
+        return
+    path = _lock_path(module, quality_dir(quality_flag), scene)
+    with polled_lock(lambda: try_flock(path), cancel_event) as locked:
+        yield locked
+
+
+@asynccontextmanager
+async def async_segment_lock(module: str, quality_flag: str, scene: str) -> AsyncIterator[None]:
+    """Async variant of segment_lock that waits without blocking the event loop"""
+    if fcntl is None:
+        yield
+        return
+    path = _lock_path(module, quality_dir(quality_flag), scene)
+    async with async_polled_lock(lambda: try_flock(path)):
+        yield
+
+
+def segment_in_use(path: Path) -> bool:
+    """Whether ``path`` is a partial movie of a scene that is rendering right now"""
+    parts = path.parts
+    if fcntl is None or "partial_movie_files" not in parts:
+        return False
+    index = parts.index("partial_movie_files")
+    if index < 2 or index + 1 >= len(parts):
+        return False
+    lock = _lock_path(parts[index - 2], parts[index - 1], parts[index + 1])
+    if not lock.exists():
+        return False
+    fd = try_flock(lock)
+    if fd is None:
+        return True
+    os.close(fd)
+    return False
@@ -0,0 +1,279 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .segment_cache import segment_in_use
+from .tex_cache import TEX_CACHE_DIR
+from utils.logging import get_metrics_registry, incr, log
+
+OUTPUT_ROOT = Path("outputs")
+STORAGE_DB = Path(os.getenv("STORAGE_DB_PATH", "outputs/cache/storage.sqlite3"))
+
+# Quotas for rendered videos, temporary scripts, Manim's byproducts and cached Tex and Text SVGs
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", str(5 * 1024 ** 3)))
+STORAGE_MAX_AGE = int(os.getenv("STORAGE_MAX_AGE", str(7 * 24 * 3600)))
+
+# Minimum seconds between full sweeps of the output tree
+SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "60"))
+
+# Files used more recently than this may belong to a render in progress and are never evicted
+MIN_EVICTION_AGE = 300
+
+# Directories under OUTPUT_ROOT the manager owns; other caches and databases manage themselves
+MANAGED_DIRS = ("videos", "temp")
+
+# Files in managed directories that are never tracked: held lock files and the Tex cache's config
+_UNMANAGED_SUFFIXES = (".lock", ".cfg")
+
+VIDEO = "video"
+TEMP = "temp"
+INTERMEDIATE = "intermediate"
+TEX = "tex"
+
+
+def artifact_kind(path: Path) -> str:
+    parts = path.parts
+    if "partial_movie_files" in parts or "images" in parts:
+        return INTERMEDIATE
+    if "Tex" in parts or "texts" in parts:
+        return TEX
+    if TEMP in parts:
+        return TEMP
+    return VIDEO
+
+
+def _is_cached(path: Path) -> bool:
+    """Hard linked into the render cache, so deleting it would free nothing"""
+    try:
+        return path.stat().st_nlink > 1
+    except OSError:
+        return False
+
+
+class StorageManager:
+    """Tracks files under outputs/ and the Tex cache and keeps them within size and age quotas
+
+    Eviction is least recently used first and skips pinned files, files
+    shared with the render cache and partial movies of scenes being rendered. Files Manim writes on its own are picked up
+    by the periodic sweep.
+    """
+
+    def __init__(self, root: Path = OUTPUT_ROOT, db_path: Path = STORAGE_DB,
+                 max_bytes: int = STORAGE_MAX_BYTES, max_age: int = STORAGE_MAX_AGE):
+        self.root = Path(root)
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._last_sweep = 0.0
+
+    def register(self, path, pinned_for: float = 0) -> None:
+        """Track a new artifact; ``pinned_for`` protects it from eviction for that many seconds"""
+        path = Path(path)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (path, kind, size, created_at, last_used, pinned_until) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(path), artifact_kind(path), size, now, now, now + pinned_for if pinned_for else 0),
+            )
+
+    def touch(self, *paths) -> None:
+        """Mark artifacts as used, e.g. partial movies a render reused"""
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            conn.executemany("UPDATE artifacts SET last_used = ? WHERE path = ?", [(now, str(path)) for path in paths])
+
+    def pin(self, path, seconds: float) -> None:
+        """Keep an artifact, e.g. a video someone is watching, for at least ``seconds``"""
+        until = time.time() + seconds
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "UPDATE artifacts SET pinned_until = MAX(pinned_until, ?), last_used = ? WHERE path = ?",
+                (until, time.time(), str(path)),
+            )
+
+    def unpin(self, path) -> None:
+        with self._lock, self._connection() as conn:
+            conn.execute("UPDATE artifacts SET pinned_until = 0 WHERE path = ?", (str(path),))
+
+    def remove(self, paths: Iterable) -> int:
+        """Delete files right away, e.g. intermediates of a finished render; returns bytes freed"""
+        freed = 0
+        removed = []
+        for path in paths:
+            path = Path(path)
+            if path.is_dir():
+                freed += sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+                shutil.rmtree(path, ignore_errors=True)
+            elif path.exists():
+                freed += path.stat().st_size
+                path.unlink()
+            removed.append(str(path))
+        with self._lock, self._connection() as conn:
+            for path in removed:
+                prefix = f"{path}{os.sep}"
+                conn.execute(
+                    "DELETE FROM artifacts WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (path, len(prefix), prefix),
+                )
+        return freed
+
+    def maybe_enforce(self) -> None:
+        """Enforce the quotas unless that happened within the last SWEEP_INTERVAL seconds"""
+        if time.monotonic() - self._last_sweep >= SWEEP_INTERVAL:
+            self.enforce()
+
+    def enforce(self) -> Dict[str, int]:
+        """Sweep the output tree, then evict expired and least recently used artifacts over quota"""
+        self._last_sweep = time.monotonic()
+        now = time.time()
+        with self._lock, self._connection() as conn:
+            self._sync(conn, now)
+            rows = conn.execute(
+                "SELECT path, size, last_used, pinned_until FROM artifacts ORDER BY last_used"
+            ).fetchall()
+
+            total = sum(size for _, size, _, _ in rows)
+            evicted: List[str] = []
+            freed = 0
+            for path, size, last_used, pinned_until in rows:
+                expired = now - last_used > self.max_age
+                if (not expired and total <= self.max_bytes) or now - last_used < MIN_EVICTION_AGE:
+                    break
+                if pinned_until > now or _is_cached(Path(path)) or segment_in_use(Path(path)):
+                    continue
+                try:
+                    Path(path).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log(f"Could not evict {path}: {e}")
+                    continue
+                evicted.append(path)
+                total -= size
+                freed += size
+            conn.executemany("DELETE FROM artifacts WHERE path = ?", [(path,) for path in evicted])
+
+        self._remove_empty_dirs()
+        if evicted:
+            incr("storage_evictions", len(evicted))
+            incr("storage_evicted_bytes", freed)
+        usage = self.usage()
+        registry = get_metrics_registry()
+        for kind, size in usage.items():
+            registry.set_gauge(f"storage_{kind}_bytes", size)
+        return usage
+
+    def usage(self) -> Dict[str, int]:
+        """Tracked bytes per artifact kind, plus the total"""
+        with self._lock, self._connection() as conn:
+            rows = conn.execute("SELECT kind, SUM(size) FROM artifacts GROUP BY kind").fetchall()
+        usage = {kind: int(size or 0) for kind, size in rows}
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def _managed_dirs(self) -> List[Path]:
+        """MANAGED_DIRS under the root, plus the shared Tex and Text cache"""
+        return [self.root / directory for directory in MANAGED_DIRS] + [TEX_CACHE_DIR]
+
+    def _sync(self, conn: sqlite3.Connection, now: float) -> None:
+        """Track files Manim created behind our back and forget files that are gone
+
+        The Tex cache bumps a file's mtime whenever a render uses it, so a newer
+        mtime counts as a use.
+        """
+        known = {
+            path: (size, last_used)
+            for path, size, last_used in conn.execute("SELECT path, size, last_used FROM artifacts")
+        }
+        seen = set()
+        for base in self._managed_dirs():
+            if not base.exists():
+                continue
+            for file in base.rglob("*"):
+                if not file.is_file() or file.name.startswith(".") or file.suffix in _UNMANAGED_SUFFIXES:
+                    continue
+                path = str(file)
+                seen.add(path)
+                stat = file.stat()
+                if path not in known:
+                    # Untracked files count as last used when they were written
+                    conn.execute(
+                        "INSERT INTO artifacts (path, kind, size, created_at, last_used, pinned_until) "
+                        "VALUES (?, ?, ?, ?, ?, 0)",
+                        (path, artifact_kind(file), stat.st_size, stat.st_mtime, stat.st_mtime),
+                    )
+                elif known[path] != (stat.st_size, max(known[path][1], stat.st_mtime)):
+                    conn.execute(
+                        "UPDATE artifacts SET size = ?, last_used = MAX(last_used, ?) WHERE path = ?",
+                        (stat.st_size, stat.st_mtime, path),
+                    )
+        gone = [(path,) for path in known if path not in seen]
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", gone)
+
+    def _remove_empty_dirs(self) -> None:
+        """Remove empty directories that sat unchanged for a while
+
+        A render creates its temp and partial movie directories before writing
+        to them, so young directories and scenes being rendered are left alone.
+        """
+        now = time.time()
+        for base in self._managed_dirs():
+            if not base.exists():
+                continue
+            # Deepest first, so parents emptied by their children go too
+            for path in sorted(base.rglob("*"), key=lambda p: len(p.parts), reverse=True):
+                if path.is_dir() and not segment_in_use(path):
+                    try:
+                        if now - path.stat().st_mtime < MIN_EVICTION_AGE:
+                            continue
+                        path.rmdir()
+                    except OSError:
+                        pass
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if not self._initialized:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            if not self._initialized:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS artifacts ("
+                    "path TEXT PRIMARY KEY, kind TEXT NOT NULL, size INTEGER NOT NULL, "
+                    "created_at REAL NOT NULL, last_used REAL NOT NULL, pinned_until REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)")
+                self._initialized = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+_storage_manager: Optional[StorageManager] = None
+
+
+def get_storage_manager() -> StorageManager:
+    """Return the process-wide storage manager"""
+    global _storage_manager
+    if _storage_manager is None:
+        _storage_manager = StorageManager()
+    return _storage_manager
+
+
+if __name__ == "__main__":
+    usage = get_storage_manager().enforce()
+    for kind, size in sorted(usage.items()):
+        print(f"{kind:<14} {size / 1024 ** 2:10.1f} MiB")
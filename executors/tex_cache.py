@@ -0,0 +1,222 @@
+import os
+import ast
+import sys
+import hashlib
+import argparse
+import functools
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from .sandbox import apply_launcher_limits
+
+try:
+    import fcntl
+except ImportError:  # Windows: cache writes aren't locked
+    fcntl = None
+
+# Node-wide cache of compiled Tex and rasterized Text SVGs, shared by every
+# render and dry run. Manim names these files by a hash of their content, so a
+# string compiled once is reused by any later render that sets it the same way.
+TEX_CACHE_DIR = Path(os.getenv("TEX_CACHE_DIR", "outputs/cache/tex"))
+
+TEX_CLASSES = {"Tex", "MathTex", "SingleStringMathTex"}
+TEXT_CLASSES = {"Text", "MarkupText"}
+# Keyword arguments that change the generated SVG and are safe to replay while warming up
+_WARM_KWARGS = {"tex_environment", "arg_separator", "font", "slant", "weight", "line_spacing", "disable_ligatures"}
+
+
+def tex_dir() -> Path:
+    return TEX_CACHE_DIR.resolve() / "Tex"
+
+
+def text_dir() -> Path:
+    return TEX_CACHE_DIR.resolve() / "texts"
+
+
+def config_file() -> Path:
+    """Manim config that points tex_dir and text_dir at the shared cache, for ``--config_file``"""
+    path = TEX_CACHE_DIR / "manim.cfg"
+    content = f"[CLI]\ntex_dir = {tex_dir()}\ntext_dir = {text_dir()}\n"
+    if not path.exists() or path.read_text(encoding="utf-8") != content:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a unique name and renamed, so no render reads a half-written file
+        temp = path.with_name(f".{path.name}.{os.getpid()}")
+        temp.write_text(content, encoding="utf-8")
+        os.replace(temp, path)
+    return path
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _is_complete_svg(path) -> bool:
+    """A process killed halfway through dvisvgm leaves a truncated file that Manim would reuse"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - 64))
+            return b"</svg>" in f.read()
+    except OSError:
+        return False
+
+
+def _locked_tex_to_svg(original):
+    @functools.wraps(original)
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        template = getattr(tex_template, "body", "")
+        key = hashlib.sha256(f"{expression}\0{environment}\0{template}".encode("utf-8")).hexdigest()[:32]
+        # Renders compiling the same string wait for the first one and then reuse its SVG
+        with _file_lock(tex_dir() / "locks" / f"{key}.lock"):
+            svg = original(expression, environment=environment, tex_template=tex_template)
+            if not _is_complete_svg(svg):
+                Path(svg).unlink(missing_ok=True)
+                svg = original(expression, environment=environment, tex_template=tex_template)
+            _mark_used(svg)
+            return svg
+    return tex_to_svg_file
+
+
+def _locked_text2svg(original):
+    @functools.wraps(original)
+    def _text2svg(self, *args, **kwargs):
+        # Pango writes the SVG in place, so renders setting the same text wait for the first one.
+        # Manim hashes the font and style settings too; keying on the text alone only makes
+        # renders of one string in different styles wait for each other.
+        text = getattr(self, "original_text", None) or getattr(self, "text", "")
+        key = hashlib.sha256(f"{type(self).__name__}\0{text}".encode("utf-8")).hexdigest()[:32]
+        with _file_lock(text_dir() / "locks" / f"{key}.lock"):
+            svg = original(self, *args, **kwargs)
+            _mark_used(svg)
+            return svg
+    return _text2svg
+
+
+def _mark_used(svg) -> None:
+    """Bump the file's mtime on every hit; storage quotas evict the cache by it"""
+    try:
+        os.utime(svg)
+    except (OSError, TypeError):
+        pass
+
+
+def install() -> None:
+    """Point Manim at the shared cache and serialize writes to it; call after importing Manim"""
+    from manim import config
+    import manim.utils.tex_file_writing as tex_file_writing
+
+    config.tex_dir = str(tex_dir())
+    config.text_dir = str(text_dir())
+    if getattr(tex_file_writing.tex_to_svg_file, "__wrapped__", None) is not None:
+        return
+
+    locked = _locked_tex_to_svg(tex_file_writing.tex_to_svg_file)
+    tex_file_writing.tex_to_svg_file = locked
+    # Modules that imported the function by name keep their own reference
+    for name in ("manim.mobject.text.tex_mobject", "manim.mobject.svg.tex_mobject"):
+        module = sys.modules.get(name)
+        if module is not None and hasattr(module, "tex_to_svg_file"):
+            module.tex_to_svg_file = locked
+
+    text_module = sys.modules.get("manim.mobject.text.text_mobject")
+    for cls_name in TEXT_CLASSES:
+        cls = getattr(text_module, cls_name, None)
+        if cls is not None and "_text2svg" in vars(cls):
+            cls._text2svg = _locked_text2svg(cls._text2svg)
+
+
+class CachedString(NamedTuple):
+    cls: str
+    args: tuple
+    kwargs: tuple
+
+
+def mine_strings(codes: Iterable[str]) -> List[CachedString]:
+    """Tex and Text calls with literal arguments in ``codes``, most frequent first"""
+    counts = {}
+    for code in codes:
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            continue
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Name):
+                continue
+            if node.func.id not in TEX_CLASSES | TEXT_CLASSES or not node.args:
+                continue
+            try:
+                args = tuple(ast.literal_eval(arg) for arg in node.args)
+                kwargs = tuple(sorted(
+                    (keyword.arg, ast.literal_eval(keyword.value))
+                    for keyword in node.keywords if keyword.arg in _WARM_KWARGS
+                ))
+            except (ValueError, TypeError, SyntaxError):
+                # f-strings, variables and the like aren't known until render time
+                continue
+            if all(isinstance(arg, str) for arg in args):
+                entry = CachedString(node.func.id, args, kwargs)
+                counts[entry] = counts.get(entry, 0) + 1
+    return sorted(counts, key=counts.get, reverse=True)
+
+
+def warm(strings: List[CachedString]) -> int:
+    """Compile ``strings`` into the shared cache; returns how many failed"""
+    import manim
+
+    install()
+    failures = 0
+    for entry in strings:
+        try:
+            getattr(manim, entry.cls)(*entry.args, **dict(entry.kwargs))
+        except Exception as e:
+            failures += 1
+            print(f"Could not warm {entry.cls}{entry.args}: {e}", file=sys.stderr)
+    return failures
+
+
+def launch_manim(argv: List[str]) -> None:
+    """Run the Manim CLI with the shared cache installed: ``python -m executors.tex_cache render ...``"""
+    from manim.__main__ import main as manim_cli
+
+    install()
+    manim_cli(args=argv, prog_name="manim")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = sys.argv[1:] if argv is None else argv
+    if args[:1] == ["render"]:
+        apply_launcher_limits()
+        launch_manim(args)
+        return 0
+
+    parser = argparse.ArgumentParser(description="Pre-populate the shared Tex/Text cache from example code")
+    parser.add_argument("--limit", type=int, default=0, help="Warm only the N most frequent strings")
+    parser.add_argument("--dry-run", action="store_true", help="List the strings without compiling them")
+    options = parser.parse_args(args)
+
+    from generators.retrieval import load_example_corpus
+
+    strings = mine_strings(code for _, code in load_example_corpus())
+    if options.limit:
+        strings = strings[:options.limit]
+    if options.dry_run:
+        for entry in strings:
+            print(entry.cls, *entry.args)
+        return 0
+    failures = warm(strings)
+    print(f"Warmed {len(strings) - failures} of {len(strings)} strings into {TEX_CACHE_DIR}")
+    return 1 if failures == len(strings) and strings else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
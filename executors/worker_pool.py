@@ -0,0 +1,314 @@
+import os
+import sys
+import time
+import queue
+import asyncio
+import signal
+import atexit
+import tempfile
+import threading
+import traceback
+import multiprocessing as mp
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, List, NamedTuple, Optional
+
+from .dry_run import main as dry_run_main
+from .progress import ProgressParser, RenderProgress
+from .tex_cache import install as install_tex_cache
+from .sandbox import ExecutionResult, SandboxLimits, apply_limits, detect_limit, mapped_bytes, maxrss_to_bytes
+
+# Number of warm Manim workers, 0 falls back to one `python -m manim` per render
+MANIM_WORKERS = int(os.getenv("MANIM_WORKERS", "2"))
+
+# How often a render waiting for an idle worker checks its cancel event
+_IDLE_POLL_SECONDS = 0.1
+
+# Extra time given to a worker to report back before it is considered hung
+WORKER_GRACE_SECONDS = 10
+
+# Message sent to a busy worker to kill its current render
+CANCEL = "cancel"
+
+# Job modes: a full Manim render, or a dry run of construct() (args are the script and scene names)
+RENDER = "render"
+DRY_RUN = "dry_run"
+
+
+class RenderJob(NamedTuple):
+    args: List[str]
+    timeout: float
+    mode: str = RENDER
+    # Kill the render when it writes no output for this long, 0 disables the check
+    stall_timeout: float = 0
+    # Resource limits the forked child runs under, None runs it unrestricted
+    limits: Optional[SandboxLimits] = None
+
+
+class _Worker(NamedTuple):
+    process: mp.Process
+    conn: "mp.connection.Connection"
+
+
+def _worker_main(conn) -> None:
+    """Import Manim once, then render each job in a fresh child forked from this process"""
+    try:
+        import manim  # noqa: F401
+        from manim.__main__ import main as manim_cli
+        install_tex_cache()
+        import_error = None
+    except Exception:
+        manim_cli = None
+        import_error = traceback.format_exc()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        if job == CANCEL:
+            # The render it was meant for already finished
+            continue
+
+        if manim_cli is None:
+            conn.send(ExecutionResult(returncode=1, stdout="", stderr=import_error))
+            continue
+        conn.send(_run_forked(job, manim_cli, conn))
+
+
+def _run_forked(job: RenderJob, manim_cli, conn) -> ExecutionResult:
+    """Fork a child off the warm worker so every render starts from the same clean state"""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                if job.limits is not None:
+                    apply_limits(job.limits, base_bytes=mapped_bytes())
+                os.dup2(out.fileno(), 1)
+                os.dup2(err.fileno(), 2)
+                if job.mode == DRY_RUN:
+                    status = dry_run_main(job.args)
+                else:
+                    manim_cli.main(args=job.args, prog_name="manim", standalone_mode=False)
+                    status = 0
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        timed_out = False
+        cancelled = False
+        stalled = False
+        parser = ProgressParser()
+        err_offset = 0
+        out_size = 0
+        deadline = time.monotonic() + job.timeout
+        last_output = time.monotonic()
+        while True:
+            waited_pid, status, usage = os.wait4(pid, os.WNOHANG)
+            if waited_pid:
+                break
+            # pread leaves the offset the child writes at untouched
+            chunk = os.pread(err.fileno(), 65536, err_offset)
+            size = os.fstat(out.fileno()).st_size
+            if chunk or size != out_size:
+                last_output = time.monotonic()
+                err_offset += len(chunk)
+                out_size = size
+                for progress in parser.feed(chunk.decode("utf-8", errors="replace")):
+                    conn.send(progress)
+            cancelled = conn.poll() and conn.recv() == CANCEL
+            timed_out = time.monotonic() > deadline
+            stalled = bool(job.stall_timeout) and time.monotonic() - last_output > job.stall_timeout
+            if cancelled or timed_out or stalled:
+                os.kill(pid, signal.SIGKILL)
+                _, status, usage = os.wait4(pid, 0)
+                break
+            time.sleep(0.05)
+
+        out.seek(0)
+        err.seek(0)
+        returncode = os.waitstatus_to_exitcode(status)
+        stderr = err.read().decode("utf-8", errors="replace")
+        limit = ""
+        if job.limits is not None and not (cancelled or timed_out or stalled):
+            limit = detect_limit(returncode, stderr, usage.ru_utime + usage.ru_stime, job.limits)
+        return ExecutionResult(
+            returncode=returncode,
+            stdout=out.read().decode("utf-8", errors="replace"),
+            stderr=stderr,
+            timed_out=timed_out or stalled,
+            peak_rss_bytes=maxrss_to_bytes(usage.ru_maxrss),
+            cancelled=cancelled,
+            stalled=stalled,
+            limit=limit,
+        )
+
+
+@contextmanager
+def _hash_seed_env() -> Iterator[None]:
+    """Spawn workers with hash randomization disabled, like the subprocess path"""
+    previous = os.environ.get("PYTHONHASHSEED")
+    os.environ["PYTHONHASHSEED"] = "0"
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("PYTHONHASHSEED", None)
+        else:
+            os.environ["PYTHONHASHSEED"] = previous
+
+
+class ManimWorkerPool:
+    """Pool of long-lived processes that keep Manim imported between renders"""
+
+    def __init__(self, size: int = MANIM_WORKERS):
+        self.size = size
+        self._context = mp.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+
+    @contextmanager
+    def checkout(self, cancel_event: Optional[threading.Event] = None) -> Iterator[Optional[_Worker]]:
+        """Hold an idle worker for one job; yields None when ``cancel_event`` is set first"""
+        self.start()
+        worker = self._take(cancel_event)
+        try:
+            yield worker
+        finally:
+            if worker is not None:
+                self._give_back(worker)
+
+    @asynccontextmanager
+    async def async_checkout(self) -> AsyncIterator[_Worker]:
+        """Async variant of checkout that waits without blocking the event loop"""
+        self.start()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+                break
+            except queue.Empty:
+                await asyncio.sleep(_IDLE_POLL_SECONDS)
+        try:
+            yield worker
+        finally:
+            self._give_back(worker)
+
+    def run(self, worker: _Worker, args: List[str], timeout: float,
+            cancel_event: Optional[threading.Event] = None, mode: str = RENDER,
+            on_progress: Optional[Callable[[RenderProgress], None]] = None,
+            stall_timeout: float = 0, limits: Optional[SandboxLimits] = None) -> ExecutionResult:
+        """Run Manim with CLI ``args`` on a ``worker`` held through checkout
+        
+        Setting ``cancel_event`` kills the render; the result then has ``cancelled`` set.
+        With ``mode=DRY_RUN`` the scenes are only executed, see ``dry_run.dry_run_scenes``.
+        ``on_progress`` is called with each progress update Manim prints.
+        The render runs under ``limits``; the result's ``limit`` names the one it hit.
+        """
+        try:
+            worker.conn.send(RenderJob(args=args, timeout=timeout, mode=mode, stall_timeout=stall_timeout, limits=limits))
+            deadline = time.monotonic() + timeout + WORKER_GRACE_SECONDS
+            cancel_sent = False
+            while True:
+                if worker.conn.poll(0.2):
+                    message = worker.conn.recv()
+                    if not isinstance(message, RenderProgress):
+                        return message
+                    if on_progress is not None:
+                        on_progress(message)
+                if cancel_event is not None and cancel_event.is_set() and not cancel_sent:
+                    worker.conn.send(CANCEL)
+                    cancel_sent = True
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Manim worker stopped responding")
+        except (EOFError, OSError, TimeoutError) as e:
+            # The worker died or hung, replace it so the pool keeps its size
+            self._replace(worker)
+            return ExecutionResult(returncode=-1, stdout="", stderr=f"Manim worker failed: {e}")
+
+    def _take(self, cancel_event: Optional[threading.Event]) -> Optional[_Worker]:
+        """Wait for an idle worker; None when ``cancel_event`` is set first"""
+        while True:
+            try:
+                return self._idle.get(timeout=_IDLE_POLL_SECONDS)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+
+    def close(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+            for worker in self._workers:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+            self._workers.clear()
+            self._idle = queue.Queue()
+            self._started = False
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        with _hash_seed_env():
+            process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        self._workers.append(worker)
+        return worker
+
+    def _give_back(self, worker: _Worker) -> None:
+        with self._lock:
+            # A worker that failed was already replaced by a fresh one
+            if worker in self._workers:
+                self._idle.put(worker)
+
+    def _replace(self, worker: _Worker) -> None:
+        with self._lock:
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.process.join(timeout=5)
+            worker.conn.close()
+            self._workers.remove(worker)
+            self._idle.put(self._spawn())
+
+
+_worker_pool: Optional[ManimWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def warm_worker_count() -> int:
+    """Size of the process-wide worker pool, 0 when warm workers are disabled"""
+    return MANIM_WORKERS if MANIM_WORKERS > 0 and hasattr(os, "fork") else 0
+
+
+def get_worker_pool() -> Optional[ManimWorkerPool]:
+    """Return the process-wide worker pool, or None when warm workers are disabled"""
+    global _worker_pool
+    if not warm_worker_count():
+        return None
+    with _pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ManimWorkerPool(MANIM_WORKERS)
+            atexit.register(_worker_pool.close)
+        return _worker_pool
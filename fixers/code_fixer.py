@@ -1,10 +1,12 @@
-from groq import Groq
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from backends import get_llm_backend
+from utils.response_cache import get_response_cache
+from verifiers.ast_verifier import verify_code
 
-def fix_code(code: str, errors: List[str], api_key: str) -> str:
-    """Attempt to fix the code based on verification errors"""
-    client = Groq(api_key=api_key)
-    
+MODEL = "llama-3.3-70b-versatile"
+
+def _build_request(code: str, errors: List[str]) -> Tuple[List[Dict[str, str]], Dict]:
+    """Build the chat messages and sampling parameters for a fix request"""
     error_message = "\n".join(errors)
     prompt = f"""The following Manim code has errors:
 {code}
@@ -17,11 +19,45 @@ Return ONLY the corrected code with no additional explanation.
 NO PREAMBLE
 without '''python at start and ''' at the end"""
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-        max_tokens=2000
-    )
+    messages = [{"role": "user", "content": prompt}]
+    params = {"temperature": 0.2, "max_tokens": 2000}
+    return messages, params
+
+def fix_code(code: str, errors: List[str], api_key: Optional[str], use_cache: bool = True) -> str:
+    """Attempt to fix the code based on verification errors
     
-    return response.choices[0].message.content
\ No newline at end of file
+    Fixes that don't pass verification are never cached. Pass ``use_cache=False``
+    where a cached fix may already have failed, such as inside a repair loop.
+    """
+    messages, params = _build_request(code, errors)
+    backend = get_llm_backend(api_key, MODEL)
+
+    # The same code with the same errors gets the cached fix
+    cache = get_response_cache()
+    cache_key = cache.make_key(backend.model, messages, params)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    content = backend.complete(messages, params)
+    if use_cache and verify_code(content)["is_valid"]:
+        cache.put(cache_key, content)
+    return content
+
+async def fix_code_async(code: str, errors: List[str], api_key: Optional[str], use_cache: bool = True) -> str:
+    """Async variant of fix_code"""
+    messages, params = _build_request(code, errors)
+    backend = get_llm_backend(api_key, MODEL)
+
+    cache = get_response_cache()
+    cache_key = cache.make_key(backend.model, messages, params)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    content = await backend.acomplete(messages, params)
+    if use_cache and verify_code(content)["is_valid"]:
+        cache.put(cache_key, content)
+    return content
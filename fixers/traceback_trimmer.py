@@ -0,0 +1,84 @@
+import re
+from typing import List, NamedTuple, Optional
+
+# Frames kept when none of them point into the generated file
+MAX_FRAMES = 3
+MAX_CHARS = 1500
+
+# `File "x.py", line 12, in construct` (plain tracebacks)
+_PLAIN_FRAME_RE = re.compile(r'File "(?P<path>[^"]+)", line (?P<line>\d+), in (?P<func>\S+)')
+# `x.py:12 in construct` (rich tracebacks printed by Manim)
+_RICH_FRAME_RE = re.compile(r"(?P<path>\S+\.py):(?P<line>\d+) in (?P<func>\S+)")
+_EXCEPTION_RE = re.compile(r"^(?P<type>[A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt))(?::\s*(?P<message>.*))?$")
+# Box drawing characters rich wraps tracebacks in
+_BOX_CHARS = "│╭╮╰╯─┃━ "
+
+
+class _Frame(NamedTuple):
+    path: str
+    line: int
+    func: str
+
+
+def _clean(line: str) -> str:
+    return line.strip().strip(_BOX_CHARS).strip()
+
+
+def _parse_frames(output: str) -> List[_Frame]:
+    frames = []
+    for raw_line in output.splitlines():
+        line = _clean(raw_line)
+        match = _PLAIN_FRAME_RE.search(line) or _RICH_FRAME_RE.search(line)
+        if match:
+            frames.append(_Frame(match.group("path"), int(match.group("line")), match.group("func")))
+    return frames
+
+
+def _find_exception(output: str) -> Optional[str]:
+    """The last `SomeError: message` line, which is the exception that ended the render"""
+    for raw_line in reversed(output.splitlines()):
+        line = _clean(raw_line)
+        if _EXCEPTION_RE.match(line):
+            return line
+    return None
+
+
+def trim_render_error(output: str, code: str, script_name: Optional[str] = None) -> str:
+    """Cut a Manim failure log down to the exception, the frames in the generated code and the failing line
+
+    ``script_name`` is the file name the code was rendered from; frames in it are
+    the ones worth showing the fixer.
+    """
+    code_lines = code.splitlines()
+    frames = _parse_frames(output)
+    exception = _find_exception(output)
+
+    if script_name:
+        relevant = [frame for frame in frames if frame.path.endswith(script_name)]
+    else:
+        relevant = []
+    from_generated_code = bool(relevant)
+    if not relevant:
+        relevant = frames[-MAX_FRAMES:]
+
+    parts = [f"Render failed with {exception}" if exception else "Render failed"]
+    for frame in relevant:
+        if from_generated_code and 0 < frame.line <= len(code_lines):
+            parts.append(f"  line {frame.line}, in {frame.func}: {code_lines[frame.line - 1].strip()}")
+        else:
+            parts.append(f"  {frame.path}:{frame.line} in {frame.func}")
+
+    if from_generated_code:
+        failing = relevant[-1]
+        if 0 < failing.line <= len(code_lines):
+            parts.append(f"Failing line {failing.line}: {code_lines[failing.line - 1].strip()}")
+
+    if not exception and not frames:
+        # Nothing recognisable, fall back to the tail of the log
+        tail = [line for line in output.splitlines() if line.strip()][-20:]
+        parts.extend(tail)
+
+    trimmed = "\n".join(parts)
+    if len(trimmed) > MAX_CHARS:
+        trimmed = trimmed[:MAX_CHARS] + "\n..."
+    return trimmed
@@ -1,23 +1,148 @@
-from groq import Groq
-from .prompts import SYSTEM_PROMPT, FEW_SHOT_EXAMPLES
+import os
+import threading
+from contextlib import closing
+from typing import Callable, Dict, List, Optional, Tuple
+from backends import get_llm_backend
+from .prompts import SYSTEM_PROMPT
+from .retrieval import select_few_shot_examples
+from utils.logging import incr, log
+from utils.response_cache import get_response_cache, normalize_prompt
+from verifiers.ast_verifier import verify_code
+from verifiers.safety_checks import StreamingCodeChecker
 
-def generate_manim_code(prompt: str, api_key: str) -> str:
-    """Generate Manim code from natural language prompt using Groq API"""
-    client = Groq(api_key=api_key)
+MODEL = "llama-3.3-70b-versatile"  # or "llama3-70b-8192", used by the Groq backend
+
+# Streams that fail the incremental checks are regenerated this many times in total
+STREAM_MAX_ATTEMPTS = max(1, int(os.getenv("STREAM_MAX_ATTEMPTS", "3")))
+
+class GenerationCancelledError(RuntimeError):
+    """Raised when generation is stopped through its cancel event"""
+
+def _build_request(prompt: str, temperature: Optional[float] = None) -> Tuple[List[Dict[str, str]], Dict, List[Dict[str, str]]]:
+    """Build the chat messages and sampling parameters for a prompt, plus the messages to key the cache on
     
-    messages = [
+    The model gets the prompt as written; the cache key uses it with whitespace
+    collapsed, so trivially different prompts share an entry.
+    """
+    normalized = normalize_prompt(prompt)
+    context = [
         {"role": "system", "content": SYSTEM_PROMPT},
-        *FEW_SHOT_EXAMPLES,
-        {"role": "user", "content": prompt}
+        # Only the corpus examples most relevant to this prompt
+        *select_few_shot_examples(normalized),
+    ]
+    messages = [*context, {"role": "user", "content": prompt}]
+    key_messages = [*context, {"role": "user", "content": normalized}]
+    params = {
+        "temperature": 0.3 if temperature is None else temperature,
+        "max_tokens": 2000,
+        "top_p": 1,
+        "stop": None,
+    }
+    return messages, params, key_messages
+
+def _cacheable(content: str) -> bool:
+    """Only code that passes verification is cached; the unchecked last attempt may not"""
+    return verify_code(content)["is_valid"]
+
+def forget_generated_code(prompt: str, api_key: Optional[str], temperature: Optional[float] = None) -> None:
+    """Drop the cached generation for ``prompt``, so code that failed to render isn't served again"""
+    _, params, key_messages = _build_request(prompt, temperature)
+    backend = get_llm_backend(api_key, MODEL)
+    cache = get_response_cache()
+    cache.delete(cache.make_key(backend.model, key_messages, params))
+
+def _retry_messages(messages: List[Dict[str, str]], error: str) -> List[Dict[str, str]]:
+    """Ask again, telling the model why its previous attempt was rejected"""
+    prompt = messages[-1]["content"]
+    return [
+        *messages[:-1],
+        {"role": "user", "content": f"{prompt}\n\nYour previous answer was rejected ({error}). Follow the rules exactly."}
     ]
+
+def generate_manim_code(prompt: str, api_key: Optional[str], use_cache: bool = True,
+                        on_token: Optional[Callable[[str], None]] = None,
+                        temperature: Optional[float] = None,
+                        cancel_event: Optional[threading.Event] = None) -> str:
+    """Generate Manim code from natural language prompt using the configured LLM backend
+    
+    The response is streamed and checked line by line; a forbidden import or a
+    missing manim header aborts the stream and regenerates. ``on_token`` is
+    called with the code written so far. Setting ``cancel_event`` closes the
+    stream with a GenerationCancelledError.
+    """
+    messages, params, key_messages = _build_request(prompt, temperature)
+    backend = get_llm_backend(api_key, MODEL)
+    
+    # Identical requests are answered from the persistent response cache
+    cache = get_response_cache()
+    cache_key = cache.make_key(backend.model, key_messages, params)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return cached
+    
+    request_messages = messages
+    for attempt in range(1, STREAM_MAX_ATTEMPTS + 1):
+        # The last attempt runs to completion and is left to the verifier and fixer
+        checker = StreamingCodeChecker() if attempt < STREAM_MAX_ATTEMPTS else None
+        content = ""
+        error = None
+        with closing(backend.stream_chat(request_messages, params)) as stream:
+            for delta in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise GenerationCancelledError("Generation was cancelled")
+                content += delta
+                if on_token:
+                    on_token(content)
+                if checker and checker.feed(delta):
+                    error = checker.error
+                    break
+        
+        if error is None:
+            if use_cache and _cacheable(content):
+                cache.put(cache_key, content)
+            return content
+        
+        incr("generation_stream_aborts")
+        log(f"Aborted generation attempt {attempt}: {error}")
+        if on_token:
+            on_token("")
+        request_messages = _retry_messages(messages, error)
+
+async def generate_manim_code_async(prompt: str, api_key: Optional[str], use_cache: bool = True) -> str:
+    """Async variant of generate_manim_code"""
+    messages, params, key_messages = _build_request(prompt)
+    backend = get_llm_backend(api_key, MODEL)
     
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",  # or "llama3-70b-8192"
-        messages=messages,
-        temperature=0.3,
-        max_tokens=2000,
-        top_p=1,
-        stop=None,
-    )
+    cache = get_response_cache()
+    cache_key = cache.make_key(backend.model, key_messages, params)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
     
-    return response.choices[0].message.content
\ No newline at end of file
+    request_messages = messages
+    for attempt in range(1, STREAM_MAX_ATTEMPTS + 1):
+        checker = StreamingCodeChecker() if attempt < STREAM_MAX_ATTEMPTS else None
+        content = ""
+        error = None
+        stream = backend.astream_chat(request_messages, params)
+        try:
+            async for delta in stream:
+                content += delta
+                if checker and checker.feed(delta):
+                    error = checker.error
+                    break
+        finally:
+            await stream.aclose()
+        
+        if error is None:
+            if use_cache and _cacheable(content):
+                cache.put(cache_key, content)
+            return content
+        
+        incr("generation_stream_aborts")
+        log(f"Aborted generation attempt {attempt}: {error}")
+        request_messages = _retry_messages(messages, error)
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .prompts import FEW_SHOT_EXAMPLES
+
+try:
+    import numpy as np
+except ImportError:  # retrieval is an optimization, fall back to the fixed examples
+    np = None
+
+CORPUS_FILE = Path("_notebooks/manim_data.json")
+PARQUET_DIR = Path("data")
+INDEX_DIR = Path("outputs/index/few_shot")
+
+# Number of retrieved prompt/code pairs attached to each request, 0 uses FEW_SHOT_EXAMPLES
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "3"))
+
+# Size of the hashed unigram + bigram feature space
+VECTOR_DIM = 4096
+
+_PAIR_RE = re.compile(
+    r'"role":\s*"user",\s*"content":\s*"(?P<prompt>.*?)"\s*\},\s*'
+    r'\{\s*"role":\s*"assistant",\s*"content":\s*"""(?P<code>.*?)"""\s*\}',
+    re.S,
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Column names used by the SFT parquet files for prompts and code
+_PROMPT_COLUMNS = ["prompt", "instruction", "question", "input"]
+_CODE_COLUMNS = ["code", "python_code", "completion", "response", "output"]
+
+
+def load_example_corpus() -> List[Tuple[str, str]]:
+    """All (prompt, code) pairs from the bundled notebook data and any SFT parquet files"""
+    pairs: List[Tuple[str, str]] = []
+    if CORPUS_FILE.exists():
+        # The notebook file holds triple-quoted code, so it isn't valid JSON
+        text = CORPUS_FILE.read_text(encoding="utf-8")
+        pairs.extend((m.group("prompt").strip(), m.group("code").strip()) for m in _PAIR_RE.finditer(text))
+    pairs.extend(_load_parquet_pairs())
+
+    seen = set()
+    unique = []
+    for prompt, code in pairs:
+        if prompt and code and prompt not in seen:
+            seen.add(prompt)
+            unique.append((prompt, code))
+    return unique
+
+
+def _load_parquet_pairs() -> List[Tuple[str, str]]:
+    files = sorted(PARQUET_DIR.glob("*.parquet")) if PARQUET_DIR.exists() else []
+    if not files:
+        return []
+    try:
+        import pandas as pd
+    except ImportError:
+        return []
+
+    pairs = []
+    for file in files:
+        frame = pd.read_parquet(file)
+        prompt_column = next((c for c in _PROMPT_COLUMNS if c in frame.columns), None)
+        code_column = next((c for c in _CODE_COLUMNS if c in frame.columns), None)
+        if prompt_column is None or code_column is None:
+            continue
+        for prompt, code in zip(frame[prompt_column], frame[code_column]):
+            if isinstance(prompt, str) and isinstance(code, str):
+                pairs.append((prompt.strip(), code.strip()))
+    return pairs
+
+
+def _features(text: str) -> Dict[int, int]:
+    """Hashed unigram and bigram counts; crc32 keeps buckets stable across processes"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    counts: Dict[int, int] = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode("utf-8")) % VECTOR_DIM
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return counts
+
+
+def _corpus_fingerprint() -> str:
+    """Changes whenever a corpus source file changes, so a stale index gets rebuilt"""
+    digest = hashlib.sha256(str(VECTOR_DIM).encode("utf-8"))
+    sources = [CORPUS_FILE] + (sorted(PARQUET_DIR.glob("*.parquet")) if PARQUET_DIR.exists() else [])
+    for source in sources:
+        if source.exists():
+            stat = source.stat()
+            digest.update(f"{source}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, write) -> None:
+    """Write through a temporary file so concurrent readers never see a partial file"""
+    staging = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(staging, "wb") as f:
+        write(f)
+    os.replace(staging, path)
+
+
+class FewShotIndex:
+    """TF-IDF index over the example corpus, persisted as .npy files and memory-mapped on load"""
+
+    def __init__(self, vectors, idf, examples: List[Tuple[str, str]]):
+        self.vectors = vectors
+        self.idf = idf
+        self.examples = examples
+
+    @classmethod
+    def build(cls, pairs: List[Tuple[str, str]]) -> "FewShotIndex":
+        counts = [_features(prompt) for prompt, _ in pairs]
+
+        document_frequency = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for features in counts:
+            document_frequency[list(features)] += 1
+        idf = (np.log((1 + len(pairs)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        vectors = np.zeros((len(pairs), VECTOR_DIM), dtype=np.float32)
+        for row, features in enumerate(counts):
+            for bucket, count in features.items():
+                vectors[row, bucket] = (1 + np.log(count)) * idf[bucket]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.maximum(norms, 1e-12)
+        return cls(vectors, idf, pairs)
+
+    def save(self, directory: Path, fingerprint: str) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(directory / "vectors.npy", lambda f: np.save(f, self.vectors))
+        _write_atomic(directory / "idf.npy", lambda f: np.save(f, self.idf))
+        _write_atomic(directory / "examples.json", lambda f: f.write(json.dumps(self.examples).encode("utf-8")))
+        # Written last, so an interrupted save is never mistaken for a complete index
+        meta = {"fingerprint": fingerprint, "dim": VECTOR_DIM}
+        _write_atomic(directory / "meta.json", lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    @classmethod
+    def load(cls, directory: Path, fingerprint: str) -> Optional["FewShotIndex"]:
+        try:
+            with open(directory / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("fingerprint") != fingerprint:
+                return None
+            with open(directory / "examples.json", "r", encoding="utf-8") as f:
+                examples = [tuple(pair) for pair in json.load(f)]
+            vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+            idf = np.load(directory / "idf.npy")
+        except (OSError, ValueError):
+            return None
+        return cls(vectors, idf, examples)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, str]]:
+        """The ``k`` examples whose prompts are most similar to ``query``, best first"""
+        query_vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+        for bucket, count in _features(query).items():
+            query_vector[bucket] = (1 + np.log(count)) * self.idf[bucket]
+        norm = np.linalg.norm(query_vector)
+        if norm == 0 or not self.examples:
+            return []
+
+        scores = self.vectors @ (query_vector / norm)
+        k = min(k, len(self.examples))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.examples[i] for i in top if scores[i] > 0]
+
+
+_index: Optional[FewShotIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_few_shot_index(rebuild: bool = False) -> Optional[FewShotIndex]:
+    """Load the persisted index, building it first if it is missing or stale"""
+    global _index
+    if np is None:
+        return None
+    with _index_lock:
+        if _index is None or rebuild:
+            fingerprint = _corpus_fingerprint()
+            index = None if rebuild else FewShotIndex.load(INDEX_DIR, fingerprint)
+            if index is None:
+                pairs = load_example_corpus()
+                if not pairs:
+                    return None
+                FewShotIndex.build(pairs).save(INDEX_DIR, fingerprint)
+                index = FewShotIndex.load(INDEX_DIR, fingerprint)
+            _index = index
+        return _index
+
+
+def select_few_shot_examples(prompt: str, k: int = FEW_SHOT_K) -> List[Dict[str, str]]:
+    """Chat messages for the ``k`` corpus examples most relevant to the prompt"""
+    index = get_few_shot_index() if k > 0 else None
+    if index is None:
+        return FEW_SHOT_EXAMPLES
+
+    matches = index.search(prompt, k)
+    if not matches:
+        return FEW_SHOT_EXAMPLES
+
+    messages = []
+    for example_prompt, example_code in matches:
+        messages.append({"role": "user", "content": example_prompt})
+        messages.append({"role": "assistant", "content": example_code})
+    return messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the few-shot example index")
+    parser.add_argument("--query", help="Show the examples retrieved for this prompt")
+    parser.add_argument("-k", type=int, default=FEW_SHOT_K, help="Number of examples to retrieve")
+    args = parser.parse_args()
+
+    index = get_few_shot_index(rebuild=True)
+    if index is None:
+        raise SystemExit("Could not build the index (is numpy installed and the corpus present?)")
+    print(f"Indexed {len(index.examples)} examples in {INDEX_DIR}")
+    if args.query:
+        for example_prompt, _ in index.search(args.query, args.k):
+            print(f"- {example_prompt}")
@@ -0,0 +1,208 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+from utils.logging import incr
+from utils.response_cache import normalize_prompt
+
+JOB_DB_PATH = Path(os.getenv("JOB_DB_PATH", "outputs/jobs.sqlite3"))
+
+# A running job whose worker hasn't renewed its lease for this long is handed to another worker
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Claims of one job before it is failed, so a job that kills its worker can't loop forever
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_COLUMNS = ("id", "prompt", "quality_flag", "status", "video_path", "code", "error",
+            "attempts", "submissions", "created_at", "updated_at")
+
+
+class Job(NamedTuple):
+    id: str
+    prompt: str
+    quality_flag: str
+    status: str
+    video_path: Optional[str]
+    code: Optional[str]
+    error: Optional[str]
+    attempts: int
+    # Submissions coalesced into this job, including the first
+    submissions: int
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+def job_id(prompt: str, quality_flag: str) -> str:
+    """Stable ID: the same prompt at the same quality always maps to the same job"""
+    digest = hashlib.sha256(f"{normalize_prompt(prompt)}\0{quality_flag}".encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+
+class JobQueue:
+    """Render jobs persisted in SQLite, shared by the web app and any number of worker processes
+
+    Submitting a prompt that is already queued or running joins the existing
+    job instead of starting a second pipeline run. Workers claim jobs under a
+    lease they renew while working, so jobs of a crashed worker are picked up again.
+    """
+
+    def __init__(self, path: Path = JOB_DB_PATH, lease_seconds: int = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def submit(self, prompt: str, quality_flag: str = "-ql") -> Job:
+        """Queue a job, or join the identical one that is queued, running or already done"""
+        prompt = normalize_prompt(prompt)
+        key = job_id(prompt, quality_flag)
+        now = time.time()
+        with self._transaction() as conn:
+            job = self._get(conn, key)
+            if job is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, prompt, quality_flag, status, attempts, submissions, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 0, 1, ?, ?)",
+                    (key, prompt, quality_flag, QUEUED, now, now),
+                )
+                incr("jobs_submitted")
+            elif job.status == FAILED or (job.status == DONE and not Path(job.video_path or "").is_file()):
+                # Failed jobs, and finished ones whose video has since been deleted, run again
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = NULL, attempts = 0, lease_owner = NULL, "
+                    "lease_expires = NULL, submissions = submissions + 1, updated_at = ? WHERE id = ?",
+                    (QUEUED, now, key),
+                )
+                incr("jobs_submitted")
+            else:
+                conn.execute("UPDATE jobs SET submissions = submissions + 1 WHERE id = ?", (key,))
+                incr("jobs_coalesced")
+            return self._get(conn, key)
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._transaction(write=False) as conn:
+            return self._get(conn, key)
+
+    def wait(self, key: str, timeout: Optional[float] = None, poll_interval: float = 0.5) -> Optional[Job]:
+        """Poll until the job finishes; returns its last state when ``timeout`` runs out"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(key)
+            if job is None or job.finished:
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                return job
+            time.sleep(poll_interval)
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """Lease the oldest queued job, or a running one whose worker stopped renewing its lease"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Jobs that used up their attempts on lost workers are failed instead of retried
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, "Worker lost while running the job", now, RUNNING, now, self.max_attempts),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row[0]),
+            )
+            return self._get(conn, row[0])
+
+    def renew(self, key: str, worker_id: str) -> bool:
+        """Extend the lease; False when the job was taken over by another worker"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + self.lease_seconds, key, RUNNING, worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, key: str, worker_id: str, video_path: str, code: str) -> None:
+        self._finish(key, worker_id, DONE, video_path=video_path, code=code)
+        incr("jobs_completed")
+
+    def fail(self, key: str, worker_id: str, error: str) -> None:
+        self._finish(key, worker_id, FAILED, error=error)
+        incr("jobs_failed")
+
+    def _finish(self, key: str, worker_id: str, status: str, video_path: Optional[str] = None,
+                code: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, video_path = ?, code = ?, error = ?, lease_owner = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (status, video_path, code, error, time.time(), key, worker_id),
+            )
+
+    def _get(self, conn: sqlite3.Connection, key: str) -> Optional[Job]:
+        row = conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (key,)).fetchone()
+        return Job(*row) if row is not None else None
+
+    @contextmanager
+    def _transaction(self, write: bool = True) -> Iterator[sqlite3.Connection]:
+        """A transaction; write transactions take the lock up front, so check-then-update is atomic across processes"""
+        if not self._initialized:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        try:
+            with self._lock:
+                if not self._initialized:
+                    # WAL lets the web app read job state while a worker writes
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        "id TEXT PRIMARY KEY, prompt TEXT NOT NULL, quality_flag TEXT NOT NULL, "
+                        "status TEXT NOT NULL, video_path TEXT, code TEXT, error TEXT, "
+                        "attempts INTEGER NOT NULL, submissions INTEGER NOT NULL, "
+                        "lease_owner TEXT, lease_expires REAL, "
+                        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+                    self._initialized = True
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
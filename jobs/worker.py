@@ -0,0 +1,103 @@
+"""Worker processes that run queued render jobs
+
+    python -m jobs.worker --processes 2
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import multiprocessing as mp
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .job_queue import Job, JobQueue, get_job_queue
+from utils.logging import Trace, append_trace, log, use_trace
+
+# Seconds between polls of an empty queue
+POLL_INTERVAL = 1.0
+
+
+def _renew_lease(queue: JobQueue, job: Job, worker_id: str, stop: threading.Event) -> None:
+    """Keep the job leased while the pipeline runs"""
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(job.id, worker_id):
+            log(f"Lost the lease on job {job.id}")
+            return
+
+
+def run_job(queue: JobQueue, animator, job: Job, worker_id: str, trace_out: Optional[str] = None) -> None:
+    trace = Trace(trace_id=job.id[:16])
+    stop = threading.Event()
+    renewer = threading.Thread(target=_renew_lease, args=(queue, job, worker_id, stop), daemon=True)
+    renewer.start()
+    try:
+        with use_trace(trace):
+            log(f"Running job {job.id} (attempt {job.attempts})")
+        result = animator.run_pipeline(job.prompt, trace, quality_flag=job.quality_flag)
+        queue.complete(job.id, worker_id, result.video_path, result.code)
+    except Exception as e:
+        queue.fail(job.id, worker_id, f"{type(e).__name__}: {e}")
+    finally:
+        stop.set()
+        renewer.join()
+        if trace_out:
+            append_trace(trace, trace_out)
+
+
+def work(queue: Optional[JobQueue] = None, trace_out: Optional[str] = None, once: bool = False) -> None:
+    """Claim and run jobs until interrupted; with ``once``, stop when the queue is empty"""
+    from main import Prompt2Anim
+
+    queue = queue or get_job_queue()
+    animator = Prompt2Anim()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    log(f"Worker {worker_id} waiting for jobs")
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        run_job(queue, animator, job, worker_id, trace_out)
+
+
+def _work_process(trace_out: Optional[str]) -> None:
+    load_dotenv()
+    try:
+        work(trace_out=trace_out)
+    except KeyboardInterrupt:
+        pass
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run queued Prompt2Anim render jobs")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--once", action="store_true", help="Exit once the queue is empty (single process)")
+    parser.add_argument("--trace-out", metavar="TRACES_JSONL", help="Append per-job traces as JSON lines")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    load_dotenv()
+    if args.once or args.processes <= 1:
+        try:
+            work(trace_out=args.trace_out, once=args.once)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    context = mp.get_context("spawn")
+    processes = [context.Process(target=_work_process, args=(args.trace_out,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
@@ -1,56 +1,425 @@
 import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 from dotenv import load_dotenv
-from generators.code_generator import generate_manim_code
+from backends import configured_backend
+from generators.code_generator import forget_generated_code, generate_manim_code, generate_manim_code_async
 from verifiers.ast_verifier import verify_code
-from fixers.code_fixer import fix_code
-from executors.manim_executor import execute_manim_code
+from fixers.code_fixer import fix_code, fix_code_async
+from fixers.traceback_trimmer import trim_render_error
+from executors.manim_executor import (
+    DRY_RUN_ENABLED, ManimRenderError, ProgressCallback, dry_run_code, execute_manim_code, execute_manim_code_async,
+)
+from executors.progress import RenderProgress
+from executors.render_cache import canonical_code_hash
+from executors.progressive import BackgroundRender
+from utils.logging import Trace, append_trace, get_metrics_registry, log, use_trace
 
 load_dotenv()
 
+# Quality of the fast first render in progressive mode
+PREVIEW_QUALITY_FLAG = "-ql"
+
+# Fix rounds per request before giving up
+MAX_REPAIR_ROUNDS = int(os.getenv("MAX_REPAIR_ROUNDS", "3"))
+
+# Candidates generated at once per prompt; the first to pass verification and the dry run is rendered.
+# 1 disables speculation. Candidate i samples at SPECULATIVE_TEMPERATURES[i], cycling when there are more.
+SPECULATIVE_CANDIDATES = int(os.getenv("SPECULATIVE_CANDIDATES", "1"))
+SPECULATIVE_TEMPERATURES = [float(t) for t in os.getenv("SPECULATIVE_TEMPERATURES", "0.3,0.7,1.0").split(",")]
+
+class PipelineResult(NamedTuple):
+    video_path: str
+    code: str
+    verification: Dict
+
+class _Candidate(NamedTuple):
+    code: str
+    # Filled in when the candidate was vetted while generating speculatively
+    verification: Optional[Dict] = None
+    errors: Optional[List[str]] = None
+    dry_run_passed: bool = False
+
+def _code_fingerprint(code: str) -> str:
+    """Identifies a fix attempt regardless of formatting and comments"""
+    return canonical_code_hash(code, "", "")
+
 class Prompt2Anim:
-    def __init__(self):
+    def __init__(self, llm_concurrency: Optional[int] = None, render_concurrency: Optional[int] = None,
+                 max_repair_rounds: Optional[int] = None, candidates: Optional[int] = None):
         self.groq_api_key = os.getenv("GROQ_API_KEY")
-        if not self.groq_api_key:
+        if not self.groq_api_key and configured_backend() == "groq":
             raise ValueError("GROQ_API_KEY not found in .env file")
+        
+        # Limits for the async pipeline: LLM calls are network bound, renders are CPU bound
+        self.llm_concurrency = llm_concurrency or int(os.getenv("LLM_CONCURRENCY", "8"))
+        self.render_concurrency = render_concurrency or int(os.getenv("RENDER_CONCURRENCY", str(os.cpu_count() or 1)))
+        self._semaphores = None
+        
+        # Fix rounds allowed after the first attempt, for verification and render failures alike
+        self.max_repair_rounds = MAX_REPAIR_ROUNDS if max_repair_rounds is None else max_repair_rounds
+        self.candidates = max(1, SPECULATIVE_CANDIDATES if candidates is None else candidates)
 
-    def process_prompt(self, prompt: str) -> str:
-        """Main pipeline: prompt -> code -> verification -> fixing -> execution"""
-        # Step 1: Generate initial code
-        generated_code = generate_manim_code(prompt, self.groq_api_key)
-        print(f"Generated code:\n{generated_code}")
+    def process_prompt(self, prompt: str, trace: Optional[Trace] = None,
+                       on_token: Optional[Callable[[str], None]] = None,
+                       quality_flag: str = "-ql",
+                       on_progress: Optional[ProgressCallback] = None) -> str:
+        """Main pipeline: prompt -> code -> verification -> fixing -> execution
+        
+        Stage timings and counters are recorded on ``trace`` (a new one if not given).
+        ``on_token`` receives the generated code as it streams in and
+        ``on_progress`` the render progress of each scene.
+        """
+        return self.run_pipeline(prompt, trace, on_token, quality_flag, on_progress).video_path
 
+    def process_prompt_progressive(self, prompt: str, quality_flag: str, trace: Optional[Trace] = None,
+                                   on_token: Optional[Callable[[str], None]] = None,
+                                   on_progress: Optional[ProgressCallback] = None) -> Tuple[str, Optional[BackgroundRender]]:
+        """Render a low quality preview, then start the requested quality in the background
+        
+        Returns the preview video and the background job, which is None when the
+        requested quality is the preview quality.
+        """
+        result = self.run_pipeline(prompt, trace, on_token, PREVIEW_QUALITY_FLAG, on_progress)
+        if quality_flag == PREVIEW_QUALITY_FLAG:
+            return result.video_path, None
+        return result.video_path, BackgroundRender(result.code, quality_flag, result.verification)
 
+    def run_pipeline(self, prompt: str, trace: Optional[Trace] = None,
+                     on_token: Optional[Callable[[str], None]] = None,
+                     quality_flag: str = "-ql",
+                     on_progress: Optional[ProgressCallback] = None) -> PipelineResult:
+        """Run the pipeline and return the video along with the code it was rendered from
         
-        # Step 2: Verify code
-        verification_result = verify_code(generated_code)
-        print(f'Code varification sucessuful')
-        if not verification_result["is_valid"]:
-            print(f"Code verification failed: {verification_result['errors']}")
-            
-            # Step 3: Attempt to fix code
-            fixed_code = fix_code(generated_code, verification_result["errors"], self.groq_api_key)
-            print(f"Attempting to fix code:\n{fixed_code}")
+        Verification and render failures are sent back to the fixer for up to
+        ``max_repair_rounds`` rounds. With more than one candidate, several are
+        generated at once and the first that passes is rendered.
+        """
+        trace = trace or Trace()
+        with use_trace(trace):
+            # Step 1: Generate initial code
+            with trace.span("generate"):
+                if self.candidates > 1:
+                    candidate = self._generate_speculative(prompt, trace, on_token)
+                else:
+                    candidate = _Candidate(generate_manim_code(prompt, self.groq_api_key, on_token=on_token))
+            generated_code = candidate.code
+            log(f"Generated code:\n{generated_code}")
             
-            # Verify fixed code
-            fixed_verification = verify_code(fixed_code)
-            if not fixed_verification["is_valid"]:
-                raise ValueError(f"Unable to fix code. Errors: {fixed_verification['errors']}")
-            
-            generated_code = fixed_code
+            attempts = {_code_fingerprint(generated_code)}
+            for repair_round in range(self.max_repair_rounds + 1):
+                if candidate.errors:
+                    # Speculative generation already found what is wrong with it
+                    errors = candidate.errors
+                else:
+                    # Step 2: Verify code
+                    with trace.span("verify"):
+                        verification_result = candidate.verification or verify_code(generated_code)
+                    if verification_result["is_valid"]:
+                        log("Code verification successful")
+                        
+                        # Step 3: Execute the code
+                        log("Executing manim code")
+                        try:
+                            with trace.span("render"):
+                                video_path = execute_manim_code(generated_code, quality_flag, verification=verification_result,
+                                                                dry_run=DRY_RUN_ENABLED and not candidate.dry_run_passed,
+                                                                on_progress=on_progress)
+                            return PipelineResult(video_path=video_path, code=generated_code, verification=verification_result)
+                        except ManimRenderError as e:
+                            errors = self._render_errors(trace, e, generated_code)
+                    else:
+                        errors = verification_result["errors"]
+                        log(f"Code verification failed: {errors}")
+                
+                if repair_round == 0 and self.candidates == 1:
+                    # Don't serve the rejected generation to the next request for this prompt
+                    forget_generated_code(prompt, self.groq_api_key)
+                
+                # Step 4: Attempt to fix code; a cached fix of this code may be the one that failed before
+                self._check_repair_budget(trace, repair_round, errors)
+                trace.incr("fix_attempts")
+                with trace.span("fix"):
+                    generated_code = fix_code(generated_code, errors, self.groq_api_key, use_cache=False)
+                log(f"Attempting to fix code:\n{generated_code}")
+                self._check_repeated_fix(trace, generated_code, attempts, errors)
+                candidate = _Candidate(generated_code)
+
+    def _generate_speculative(self, prompt: str, trace: Trace,
+                              on_token: Optional[Callable[[str], None]] = None) -> _Candidate:
+        """Generate candidates concurrently and return the first that verifies and dry runs cleanly
+        
+        The others are cancelled. When none passes, the lowest temperature
+        candidate is returned with its errors for the repair loop.
+        """
+        cancel_event = threading.Event()
+        stream_lock = threading.Lock()
+
+        def stream(code: str) -> None:
+            # Once the race is decided the caller shows the winner, not the rest of candidate 0
+            with stream_lock:
+                if not cancel_event.is_set():
+                    on_token(code)
+
+        pool = ThreadPoolExecutor(max_workers=self.candidates, thread_name_prefix="candidate")
+        futures = {}
+        for index in range(self.candidates):
+            temperature = SPECULATIVE_TEMPERATURES[index % len(SPECULATIVE_TEMPERATURES)]
+            # Only the first candidate streams to the caller; each gets a context copy so metrics land on the trace
+            futures[pool.submit(contextvars.copy_context().run, self._vet_candidate, trace, prompt, temperature,
+                                cancel_event, stream if on_token and index == 0 else None)] = index
+        trace.incr("speculative_candidates", self.candidates)
+        
+        failed: Dict[int, _Candidate] = {}
+        error: Optional[Exception] = None
+        winner: Optional[_Candidate] = None
+        pending = set(futures)
+        try:
+            while pending and winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=futures.get):
+                    index = futures[future]
+                    try:
+                        candidate = future.result()
+                    except Exception as e:
+                        log(f"Candidate {index} failed: {e}")
+                        error = error or e
+                        continue
+                    if not candidate.errors:
+                        trace.record("speculative_winner", index)
+                        winner = candidate
+                        break
+                    failed[index] = candidate
+        finally:
+            # Stragglers notice the event within one token or one poll and exit in the background
+            with stream_lock:
+                cancel_event.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+        
+        if winner is None:
+            trace.incr("speculative_misses")
+            if not failed:
+                raise error
+            winner = failed[min(failed)]
+        if on_token:
+            on_token(winner.code)
+        return winner
 
+    def _vet_candidate(self, trace: Trace, prompt: str, temperature: float, cancel_event: threading.Event,
+                       on_token: Optional[Callable[[str], None]] = None) -> _Candidate:
+        """Generate one candidate, then verify it and dry run it"""
+        code = generate_manim_code(prompt, self.groq_api_key, on_token=on_token, temperature=temperature,
+                                   cancel_event=cancel_event)
+        verification = verify_code(code)
+        if not verification["is_valid"]:
+            candidate = _Candidate(code, verification, errors=verification["errors"])
+        elif not DRY_RUN_ENABLED:
+            return _Candidate(code, verification)
+        else:
+            try:
+                dry_run_code(code, verification, cancel_event)
+                return _Candidate(code, verification, dry_run_passed=True)
+            except ManimRenderError as e:
+                candidate = _Candidate(code, verification, errors=self._render_errors(trace, e, code))
+        # A rejected candidate mustn't come back from the cache on the next request
+        forget_generated_code(prompt, self.groq_api_key, temperature)
+        return candidate
 
+    async def process_prompt_async(self, prompt: str, trace: Optional[Trace] = None) -> str:
+        """Async pipeline that overlaps LLM round trips with renders of other requests"""
+        llm_semaphore, render_semaphore = self._get_semaphores()
+        trace = trace or Trace()
+        with use_trace(trace):
+            async with llm_semaphore:
+                with trace.span("generate"):
+                    generated_code = await generate_manim_code_async(prompt, self.groq_api_key)
             
+            attempts = {_code_fingerprint(generated_code)}
+            for repair_round in range(self.max_repair_rounds + 1):
+                with trace.span("verify"):
+                    verification_result = verify_code(generated_code)
+                if verification_result["is_valid"]:
+                    try:
+                        async with render_semaphore:
+                            with trace.span("render"):
+                                return await execute_manim_code_async(generated_code, verification=verification_result)
+                    except ManimRenderError as e:
+                        errors = self._render_errors(trace, e, generated_code)
+                else:
+                    errors = verification_result["errors"]
+                    log(f"Code verification failed: {errors}")
+                
+                if repair_round == 0:
+                    forget_generated_code(prompt, self.groq_api_key)
+                
+                self._check_repair_budget(trace, repair_round, errors)
+                trace.incr("fix_attempts")
+                async with llm_semaphore:
+                    with trace.span("fix"):
+                        generated_code = await fix_code_async(generated_code, errors, self.groq_api_key, use_cache=False)
+                self._check_repeated_fix(trace, generated_code, attempts, errors)
+
+    def _render_errors(self, trace: Trace, error: ManimRenderError, code: str) -> List[str]:
+        """The fixer only gets the exception and the frames in the generated code, not the whole log"""
+        trace.incr("render_failures")
+        trimmed = trim_render_error(error.output, code, error.script_name)
+        if error.limit:
+            # A runaway scene rarely leaves a useful traceback, so say what it ran out of
+            trimmed = f"{error}; make the scene do less work (fewer sample points, shorter animations, updaters that stop)\n{trimmed}"
+        log(f"Render failed:\n{trimmed}")
+        return [trimmed]
+
+    def _check_repair_budget(self, trace: Trace, repair_round: int, errors: List[str]) -> None:
+        if repair_round >= self.max_repair_rounds:
+            trace.incr("fix_failures")
+            raise ValueError(f"Unable to fix code. Errors: {errors}")
+
+    def _check_repeated_fix(self, trace: Trace, code: str, attempts: Set[str], errors: List[str]) -> None:
+        """Stop early when the fixer hands back code that already failed"""
+        fingerprint = _code_fingerprint(code)
+        if fingerprint in attempts:
+            trace.incr("fix_failures")
+            trace.incr("fix_repeats")
+            raise ValueError(f"Unable to fix code, the fixer repeated a previous attempt. Errors: {errors}")
+        attempts.add(fingerprint)
+
+    def _get_semaphores(self) -> Tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        """Semaphores belong to an event loop, so create them for the running one"""
+        loop = asyncio.get_running_loop()
+        if self._semaphores is None or self._semaphores[0] is not loop:
+            self._semaphores = (
+                loop,
+                asyncio.Semaphore(self.llm_concurrency),
+                asyncio.Semaphore(self.render_concurrency),
+            )
+        return self._semaphores[1], self._semaphores[2]
+
+# Batch mode: each worker process keeps its own pipeline instance
+_batch_animator: Optional[Prompt2Anim] = None
+
+def _init_batch_worker() -> None:
+    global _batch_animator
+    _batch_animator = Prompt2Anim()
+
+def _run_batch_item(item: Dict, trace_out: Optional[str] = None) -> Dict:
+    """Run one batch prompt and describe the outcome as a result record"""
+    trace = Trace()
+    record = {"id": item["id"], "trace_id": trace.trace_id, "prompt": item["prompt"], "video_path": None, "error": None}
+    start = time.perf_counter()
+    try:
+        record["video_path"] = _batch_animator.process_prompt(item["prompt"], trace=trace)
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    timings = trace.stage_timings()
+    timings["total"] = time.perf_counter() - start
+    record["timings"] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    if trace_out:
+        append_trace(trace, trace_out)
+    return record
+
+def _read_batch_prompts(input_path: str) -> Iterator[Dict]:
+    """Stream prompts from a JSONL file; ids default to the line number"""
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            yield {"id": str(entry.get("id", line_number)), "prompt": entry["prompt"]}
+
+def _completed_batch_ids(output_path: str) -> Set[str]:
+    """Ids already written to the output file, so a restarted batch can skip them"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                completed.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                # A crash can leave a truncated last line behind
+                continue
+    return completed
+
+def run_batch(input_path: str, output_path: str, workers: int = 2, trace_out: Optional[str] = None) -> int:
+    """Process a JSONL file of prompts on a process pool, appending one JSONL result per prompt"""
+    completed = _completed_batch_ids(output_path)
+    if completed:
+        print(f"Resuming batch, skipping {len(completed)} completed prompts")
+    
+    processed = 0
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as pool, \
+            open(output_path, "a", encoding="utf-8") as out:
         
-        # Step 4: Execute the code
-        print(f'executing manim code')
-        video_path = execute_manim_code(generated_code)
-        return video_path
+        def write_finished(done) -> None:
+            nonlocal processed
+            for future in done:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+                processed += 1
+                status = record["video_path"] or f"failed: {record['error']}"
+                print(f"[{record['id']}] {status}")
+        
+        for item in _read_batch_prompts(input_path):
+            if item["id"] in completed:
+                continue
+            # Keep a bounded number of prompts in flight instead of reading the whole file
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_finished(done)
+            pending.add(pool.submit(_run_batch_item, item, trace_out))
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_finished(done)
+    
+    return processed
+
+def _print_progress(progress: RenderProgress) -> None:
+    """Redraw a single status line with the latest render progress"""
+    print(f"\rRendering {progress.scene}, animation {progress.animation + 1}: "
+          f"{progress.percent:5.1f}% ({progress.frames}/{progress.total_frames} frames)", end="", flush=True)
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Turn animation prompts into Manim videos")
+    parser.add_argument("--batch", metavar="PROMPTS_JSONL", help="JSONL file of prompts to process")
+    parser.add_argument("--output", metavar="RESULTS_JSONL", default="outputs/batch_results.jsonl",
+                        help="JSONL file results are appended to (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=2, help="Number of batch worker processes")
+    parser.add_argument("--trace-out", metavar="TRACES_JSONL", help="Append per-request traces as JSON lines")
+    parser.add_argument("--metrics", action="store_true", help="Print a Prometheus-style metrics snapshot at exit")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = _parse_args()
+    if args.batch:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        count = run_batch(args.batch, args.output, workers=args.workers, trace_out=args.trace_out)
+        print(f"Batch finished, {count} prompts processed. Results in {args.output}")
+        sys.exit(0)
+    
     animator = Prompt2Anim()
     prompt = input("Enter your animation prompt: ")
+    trace = Trace()
     try:
-        video_path = animator.process_prompt(prompt)
-        print(f"Animation successfully created at: {video_path}")
+        video_path = animator.process_prompt(prompt, trace=trace, on_progress=_print_progress)
+        print(f"\nAnimation successfully created at: {video_path}")
     except Exception as e:
-        print(f"Error creating animation: {str(e)}")
\ No newline at end of file
+        print(f"Error creating animation: {str(e)}")
+    
+    if args.trace_out:
+        append_trace(trace, args.trace_out)
+    if args.metrics:
+        print(get_metrics_registry().to_prometheus())
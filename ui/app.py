@@ -1,8 +1,8 @@
 import os
 import time
+import threading
 import streamlit as st
-from PIL import Image
-from pathlib import Path
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 
 import sys
@@ -11,6 +11,10 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from main import Prompt2Anim
+from executors.storage import get_storage_manager
+from jobs.job_queue import DONE, FAILED, RUNNING, get_job_queue
+from ui.video_server import is_servable, start_video_server, video_url
+from utils.logging import Trace, get_metrics_registry
 
 
 from ui.components.header import show_header
@@ -34,6 +38,84 @@ def local_css(file_name):
 def get_animator():
     return Prompt2Anim()
 
+# Videos are streamed by a side server with range requests instead of being read into the page
+@st.cache_resource
+def get_video_server():
+    return start_video_server()
+
+# Hand prompts to `python -m jobs.worker` processes instead of running the pipeline in the app
+USE_JOB_QUEUE = os.getenv("JOB_QUEUE", "0") == "1"
+
+# Videos shown to a user are kept at least this long, even when storage is over quota
+VIDEO_PIN_SECONDS = 3600
+
+# Manim quality flags for the options of the quality selector
+QUALITY_FLAGS = {
+    "Low (Fast)": "-ql",
+    "Medium": "-qm",
+    "High (Slow)": "-qh",
+}
+
+def show_video(video_path):
+    get_storage_manager().pin(video_path, VIDEO_PIN_SECONDS)
+    # Videos the server doesn't hand out, or a server that couldn't bind its port, are read into the page
+    if not is_servable(video_path) or get_video_server() is None:
+        st.video(video_path)
+        with open(video_path, "rb") as file:
+            st.download_button(
+                label="Download Animation",
+                data=file,
+                file_name=os.path.basename(video_path),
+                mime="video/mp4"
+            )
+        return
+
+    st.video(video_url(video_path))
+    st.link_button("Download Animation", video_url(video_path, download=True))
+
+def show_video_panel():
+    """Show the final video when it is ready, the preview otherwise"""
+    video_path = st.session_state["preview_path"]
+    final_job = st.session_state.get("final_render")
+    if final_job is not None and final_job.done() and not final_job.cancelled:
+        error = final_job.error()
+        if error is None:
+            video_path = final_job.result()
+        else:
+            st.warning(f"Final quality render failed, showing the preview: {error}")
+    elif final_job is not None and not final_job.done():
+        st.info("Showing a quick preview while the selected quality renders...")
+    
+    show_video(video_path)
+
+@st.fragment(run_every=2)
+def poll_final_render():
+    """Re-check the background render until it finishes, then swap in the final video"""
+    final_job = st.session_state.get("final_render")
+    if final_job is None or final_job.done():
+        st.rerun()
+    show_video_panel()
+
+@st.fragment(run_every=2)
+def show_job(job_id):
+    """Poll a queued job; its ID is in the URL, so a refresh picks it up again"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        st.error("Unknown job")
+    elif job.status == DONE:
+        show_video(job.video_path)
+    elif job.status == FAILED:
+        st.error(f"Error generating animation: {job.error}")
+    else:
+        waiting = "Rendering" if job.status == RUNNING else "Waiting for a worker"
+        st.info(f"{waiting}... (job {job.id})")
+
+def submit_job(prompt, quality):
+    job = get_job_queue().submit(prompt, QUALITY_FLAGS[quality])
+    st.query_params["job"] = job.id
+    if job.submissions > 1 and not job.finished:
+        st.caption("The same animation is already being made, joining it.")
+
 def main():
     # Load assets
     local_css("ui/assets/style.css")
@@ -66,32 +148,69 @@ def main():
             submitted = st.form_submit_button("Generate Animation")
     
     # Animation generation
-    if submitted and prompt:
+    if USE_JOB_QUEUE:
+        if submitted and prompt:
+            submit_job(prompt, quality)
+        if st.query_params.get("job"):
+            show_job(st.query_params["job"])
+    elif submitted and prompt:
+        # A new prompt supersedes the final-quality render of the previous one
+        previous_job = st.session_state.pop("final_render", None)
+        if previous_job is not None:
+            previous_job.cancel()
+        st.session_state.pop("preview_path", None)
+        
         with st.spinner("Creating your animation..."):
+            trace = Trace()
             try:
                 animator = get_animator()
                 start_time = time.time()
                 
-                # Generate animation
-                video_path = animator.process_prompt(prompt)
-                
-                # Display results
-                st.success(f"Animation generated in {time.time()-start_time:.1f} seconds!")
+                # Tokens and render progress arrive on candidate and render threads,
+                # which need this script's context to draw
+                script_context = get_script_run_ctx()
                 
-                # Show video
-                st.video(video_path)
+                # Show the code as it is written
+                code_box = st.empty()
+                def show_code(code: str) -> None:
+                    add_script_run_ctx(threading.current_thread(), script_context)
+                    if not code or code.endswith("\n"):
+                        code_box.code(code, language="python")
                 
-                # Download button
-                with open(video_path, "rb") as file:
-                    st.download_button(
-                        label="Download Animation",
-                        data=file,
-                        file_name=Path(video_path).name,
-                        mime="video/mp4"
+                progress_bar = st.empty()
+                def show_progress(progress) -> None:
+                    add_script_run_ctx(threading.current_thread(), script_context)
+                    progress_bar.progress(
+                        min(int(progress.percent), 100),
+                        text=f"{progress.scene}: animation {progress.animation + 1} "
+                             f"({progress.frames}/{progress.total_frames} frames)"
                     )
                 
+                # Generate a fast preview; the chosen quality renders in the background
+                preview_path, final_job = animator.process_prompt_progressive(
+                    prompt, QUALITY_FLAGS[quality], trace=trace, on_token=show_code, on_progress=show_progress
+                )
+                progress_bar.empty()
+                st.session_state["preview_path"] = preview_path
+                st.session_state["final_render"] = final_job
+                
+                # Display results
+                st.success(f"Animation generated in {time.time()-start_time:.1f} seconds!")
+                
             except Exception as e:
                 st.error(f"Error generating animation: {str(e)}")
+            
+            # Pipeline timings for this request and the process-wide metrics
+            with st.expander(f"Pipeline metrics (trace {trace.trace_id})"):
+                st.code(trace.to_json_lines(), language="json")
+                st.code(get_metrics_registry().to_prometheus(), language="text")
+    
+    if not USE_JOB_QUEUE and st.session_state.get("preview_path"):
+        final_job = st.session_state.get("final_render")
+        if final_job is not None and not final_job.done():
+            poll_final_render()
+        else:
+            show_video_panel()
     
     st.markdown("""
         </div>
@@ -0,0 +1,204 @@
+import os
+import re
+import sys
+import hashlib
+import mimetypes
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit, parse_qs
+
+from executors.manim_executor import OUTPUT_DIR
+from executors.render_cache import CACHE_DIR
+
+# Only videos below these directories are served, each under its own URL prefix;
+# the rest of outputs/ (databases, scripts, batch results) stays private
+VIDEO_ROOTS = {
+    "videos": OUTPUT_DIR,
+    "cache": CACHE_DIR,
+}
+VIDEO_SUFFIXES = {".mp4"}
+
+VIDEO_SERVER_HOST = os.getenv("VIDEO_SERVER_HOST", "127.0.0.1")
+VIDEO_SERVER_PORT = int(os.getenv("VIDEO_SERVER_PORT", "8502"))
+# Address browsers use to reach the server, when it differs from host and port (e.g. behind a proxy)
+VIDEO_SERVER_URL = os.getenv("VIDEO_SERVER_URL", f"http://localhost:{VIDEO_SERVER_PORT}")
+
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def _etag(stat: os.stat_result) -> str:
+    digest = hashlib.sha1(f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}".encode("utf-8"))
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single ``bytes=`` range, or None when it can't be satisfied"""
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range: the last N bytes
+        if not end or int(end) == 0:
+            return None
+        return max(0, size - int(end)), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+class VideoRequestHandler(BaseHTTPRequestHandler):
+    """Serves videos under VIDEO_ROOTS in chunks, with Range, ETag and conditional request support"""
+
+    protocol_version = "HTTP/1.1"
+    roots = VIDEO_ROOTS
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self._serve(send_body=False)
+
+    def do_GET(self) -> None:
+        self._serve(send_body=True)
+
+    def _resolve(self, url_path: str) -> Optional[Path]:
+        prefix, _, relative = unquote(url_path).lstrip("/").partition("/")
+        if prefix not in self.roots:
+            return None
+        root = self.roots[prefix].resolve()
+        path = (root / relative).resolve()
+        if root not in path.parents or path.suffix.lower() not in VIDEO_SUFFIXES or not path.is_file():
+            return None
+        return path
+
+    def _serve(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        path = self._resolve(url.path)
+        if path is None:
+            self._send_empty(404)
+            return
+
+        stat = path.stat()
+        size = stat.st_size
+        etag = _etag(stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self._send_empty(304, etag=etag)
+            return
+
+        status = 200
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        # A stale If-Range means the client's partial copy is outdated; send the whole file
+        if range_header and (if_range is None or if_range in (etag, last_modified)):
+            byte_range = parse_range(range_header, size)
+            if byte_range is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+            start, end = byte_range
+
+        self.send_response(status)
+        self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(max(0, end - start + 1)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", "private, max-age=3600")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        if "download" in parse_qs(url.query):
+            self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+        self.end_headers()
+
+        if send_body and size:
+            self._send_file(path, start, end - start + 1)
+
+    def _send_file(self, path: Path, offset: int, length: int) -> None:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            remaining = length
+            try:
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # Players routinely drop a request when seeking
+                self.close_connection = True
+
+    def _send_empty(self, status: int, etag: Optional[str] = None) -> None:
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_video_server(host: str = VIDEO_SERVER_HOST, port: int = VIDEO_SERVER_PORT) -> Optional[ThreadingHTTPServer]:
+    """Start the server on a daemon thread, once per process; None when the port can't be bound"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                server = ThreadingHTTPServer((host, port), VideoRequestHandler)
+            except OSError as e:
+                # Usually another app instance already holds the port
+                print(f"Could not start the video server on {host}:{port}: {e}", file=sys.stderr)
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="video-server", daemon=True).start()
+            _server = server
+        return _server
+
+
+def _video_root(path: Path) -> Optional[Tuple[str, Path]]:
+    for prefix, root in VIDEO_ROOTS.items():
+        root = root.resolve()
+        if root in path.parents:
+            return prefix, root
+    return None
+
+
+def is_servable(video_path) -> bool:
+    """Whether the video server hands out ``video_path``"""
+    path = Path(video_path).resolve()
+    return path.suffix.lower() in VIDEO_SUFFIXES and _video_root(path) is not None
+
+
+def video_url(video_path, download: bool = False) -> str:
+    """URL of a servable video on the video server"""
+    path = Path(video_path).resolve()
+    prefix, root = _video_root(path)
+    url = f"{VIDEO_SERVER_URL}/{prefix}/{quote(path.relative_to(root).as_posix())}"
+    return f"{url}?download=1" if download else url
+
+
+if __name__ == "__main__":
+    server = start_video_server()
+    if server is None:
+        sys.exit(1)
+    print(f"Serving {', '.join(str(root) for root in VIDEO_ROOTS.values())} on http://{VIDEO_SERVER_HOST}:{VIDEO_SERVER_PORT}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,232 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Callable, Dict, Iterator, NamedTuple, Optional
+
+import httpx
+import groq
+from groq import AsyncGroq, Groq
+
+from .logging import incr, log
+
+# Point at a local stub server for tests and benchmarks, None uses the Groq API
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Requests to the API in flight at once, per process
+GROQ_MAX_IN_FLIGHT = int(os.getenv("GROQ_MAX_IN_FLIGHT", "8"))
+
+# Retries after the first attempt for rate limits, 5xx responses and connection errors
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+GROQ_BACKOFF_BASE = 0.5
+GROQ_BACKOFF_MAX = 30.0
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+
+# Keep-alive connections held open per client
+KEEPALIVE_CONNECTIONS = 16
+
+_RETRYABLE_ERRORS = (groq.RateLimitError, groq.InternalServerError, groq.APIConnectionError)
+
+
+def retry_delay(attempt: int, error: Optional[Exception] = None) -> float:
+    """Seconds to wait before retry number ``attempt`` (starting at 0)
+
+    A retry-after header on the error's response wins; otherwise exponential
+    backoff with full jitter, so clients that failed together don't retry together.
+    """
+    server_delay = _retry_after(error)
+    if server_delay is not None:
+        return min(server_delay, GROQ_BACKOFF_MAX)
+    return random.uniform(0, min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt))
+
+
+def _retry_after(error: Optional[Exception]) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                # HTTP date form
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    return isinstance(error, _RETRYABLE_ERRORS)
+
+
+def _count_retry(error: Exception, attempt: int, delay: float) -> None:
+    incr("llm_rate_limited" if isinstance(error, groq.RateLimitError) else "llm_transient_errors")
+    incr("llm_retries")
+    log(f"Groq request failed ({type(error).__name__}), retry {attempt + 1} in {delay:.2f}s")
+
+
+class _LoopState(NamedTuple):
+    """Async clients and their semaphore, which belong to one event loop"""
+
+    semaphore: asyncio.Semaphore
+    clients: Dict[str, AsyncGroq]
+    # Closes the clients when the loop shuts down
+    watcher: "asyncio.Task[None]"
+
+
+class GroqClientManager:
+    """Shared Groq clients with connection reuse, retries and a cap on requests in flight
+
+    The SDK's own retries are disabled so that every retry goes through
+    ``retry_delay`` and is counted in the metrics.
+    """
+
+    def __init__(self, base_url: Optional[str] = GROQ_BASE_URL, max_in_flight: int = GROQ_MAX_IN_FLIGHT,
+                 max_retries: int = GROQ_MAX_RETRIES, timeout: float = GROQ_TIMEOUT):
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Groq] = {}
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._loop_states: Dict[asyncio.AbstractEventLoop, _LoopState] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=KEEPALIVE_CONNECTIONS)
+
+    def client(self, api_key: str) -> Groq:
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = Groq(
+                    api_key=api_key,
+                    base_url=self.base_url,
+                    max_retries=0,
+                    timeout=self.timeout,
+                    http_client=httpx.Client(limits=self._limits(), timeout=self.timeout),
+                )
+                self._clients[api_key] = client
+            return client
+
+    def async_client(self, api_key: str) -> AsyncGroq:
+        clients = self._loop_state().clients
+        client = clients.get(api_key)
+        if client is None:
+            client = AsyncGroq(
+                api_key=api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=httpx.AsyncClient(limits=self._limits(), timeout=self.timeout),
+            )
+            clients[api_key] = client
+        return client
+
+    def _loop_state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loop_states.get(loop)
+            if state is None:
+                # Loops closed without cancelling their tasks never ran their watcher
+                for closed in [other for other in self._loop_states if other.is_closed()]:
+                    del self._loop_states[closed]
+                clients: Dict[str, AsyncGroq] = {}
+                watcher = loop.create_task(self._close_on_shutdown(loop, clients))
+                state = _LoopState(asyncio.Semaphore(self.max_in_flight), clients, watcher)
+                self._loop_states[loop] = state
+            return state
+
+    async def _close_on_shutdown(self, loop: asyncio.AbstractEventLoop, clients: Dict[str, AsyncGroq]) -> None:
+        """Wait until cancelled, then close the loop's clients and their connection pools
+
+        asyncio.run cancels the tasks still pending once its main coroutine
+        returns, while the loop can still run the close.
+        """
+        try:
+            await asyncio.Event().wait()
+        finally:
+            with self._lock:
+                self._loop_states.pop(loop, None)
+            for client in clients.values():
+                await client.close()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one of the in-flight slots, e.g. for the whole of a streamed response"""
+        with self._in_flight:
+            yield
+
+    @asynccontextmanager
+    async def async_slot(self) -> AsyncIterator[None]:
+        async with self._loop_state().semaphore:
+            yield
+
+    def retry(self, func: Callable, *args, **kwargs):
+        """Call ``func`` and retry rate limits and transient failures with backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = retry_delay(attempt, e)
+                _count_retry(e, attempt, delay)
+                time.sleep(delay)
+
+    async def retry_async(self, func: Callable, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = retry_delay(attempt, e)
+                _count_retry(e, attempt, delay)
+                await asyncio.sleep(delay)
+
+    def create_completion(self, api_key: str, **params):
+        """A non-streamed chat completion, holding a slot and retrying as needed"""
+        client = self.client(api_key)
+        with self.slot():
+            return self.retry(client.chat.completions.create, **params)
+
+    async def create_completion_async(self, api_key: str, **params):
+        client = self.async_client(api_key)
+        async with self.async_slot():
+            return await self.retry_async(client.chat.completions.create, **params)
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    async def aclose(self) -> None:
+        """Close the async clients of the running loop, for loops not run by asyncio.run"""
+        with self._lock:
+            state = self._loop_states.get(asyncio.get_running_loop())
+        if state is not None:
+            state.watcher.cancel()
+            await asyncio.gather(state.watcher, return_exceptions=True)
+
+
+_manager: Optional[GroqClientManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_groq_manager() -> GroqClientManager:
+    """Return the process-wide client manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = GroqClientManager()
+        return _manager
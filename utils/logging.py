@@ -0,0 +1,179 @@
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+METRIC_PREFIX = "prompt2anim"
+
+
+class Span(NamedTuple):
+    name: str
+    start: float
+    duration: float
+    attributes: Dict
+
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and duration summaries with a Prometheus text export"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        # name -> [count, sum, max]
+        self.summaries: Dict[str, List[float]] = {}
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self.summaries.setdefault(name, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def to_prometheus(self) -> str:
+        """Snapshot of every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, value in sorted(self.gauges.items()):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+            for name, (count, total, peak) in sorted(self.summaries.items()):
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# TYPE {metric} summary")
+                lines.append(f"{metric}_count {count}")
+                lines.append(f"{metric}_sum {total:.6f}")
+                lines.append(f"# TYPE {metric}_max gauge")
+                lines.append(f"{metric}_max {peak:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+
+class Trace:
+    """Timed spans, counters and values recorded for a single pipeline request"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = {}
+        self.values: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict]:
+        """Time the block as stage ``name``; the yielded dict can take extra attributes"""
+        start = time.time()
+        began = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - began
+            self.spans.append(Span(name=name, start=start, duration=duration, attributes=attributes))
+            _registry.observe(f"{name}_duration_seconds", duration)
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+        _registry.incr(name, amount)
+
+    def record(self, name: str, value: float) -> None:
+        self.values[name] = value
+        _registry.observe(name, value)
+
+    def stage_timings(self) -> Dict[str, float]:
+        """Total seconds per stage name"""
+        timings: Dict[str, float] = {}
+        for span in self.spans:
+            timings[span.name] = timings.get(span.name, 0.0) + span.duration
+        return timings
+
+    def to_json_lines(self) -> str:
+        """One JSON line per span followed by a summary line for the whole trace"""
+        lines = [
+            json.dumps({
+                "trace_id": self.trace_id,
+                "span": span.name,
+                "start": round(span.start, 6),
+                "duration": round(span.duration, 6),
+                **span.attributes,
+            })
+            for span in self.spans
+        ]
+        lines.append(json.dumps({
+            "trace_id": self.trace_id,
+            "summary": True,
+            "timings": {name: round(seconds, 6) for name, seconds in self.stage_timings().items()},
+            "counters": self.counters,
+            "values": self.values,
+        }))
+        return "\n".join(lines) + "\n"
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("prompt2anim_trace", default=None)
+
+
+@contextmanager
+def use_trace(trace: Trace) -> Iterator[Trace]:
+    """Make ``trace`` the current trace for code running inside the block"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def incr(name: str, amount: float = 1) -> None:
+    """Count on the current trace, or only in the process metrics outside of one"""
+    trace = current_trace()
+    if trace is not None:
+        trace.incr(name, amount)
+    else:
+        _registry.incr(name, amount)
+
+
+def record(name: str, value: float) -> None:
+    """Record a value on the current trace, or only in the process metrics outside of one"""
+    trace = current_trace()
+    if trace is not None:
+        trace.record(name, value)
+    else:
+        _registry.observe(name, value)
+
+
+def log(message: str) -> None:
+    """Print a pipeline message tagged with the current trace ID"""
+    trace = current_trace()
+    prefix = f"[{trace.trace_id}] " if trace is not None else ""
+    print(f"{prefix}{message}")
+
+
+def append_trace(trace: Trace, path: str) -> None:
+    """Append a trace as JSON lines, in a single write so concurrent writers don't interleave"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(trace.to_json_lines())
@@ -1,51 +1,207 @@
 import ast
-import re
-from typing import Dict, List
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Type
+from .safety_checks import DANGEROUS_CALLS, DANGEROUS_MODULES
+
+# Base classes that make a class renderable, besides subclasses of scenes defined in the same file
+SCENE_BASE_SUFFIX = "Scene"
+
+
+class Diagnostic(NamedTuple):
+    rule: str
+    message: str
+    line: int = 0
+    col: int = 0
+    severity: str = "error"
+
+    def __str__(self) -> str:
+        if self.line:
+            return f"Line {self.line}: {self.message}"
+        return self.message
+
+
+class VerificationContext:
+    """State shared by the rules during a single traversal"""
+
+    def __init__(self):
+        self.diagnostics: List[Diagnostic] = []
+        self.scenes: List[str] = []
+        # Scene classes' bases that are scenes of the same file, and the scenes defining construct()
+        self.scene_bases: Dict[str, List[str]] = {}
+        self.constructs: Set[str] = set()
+        self.has_manim_import = False
+
+    def report(self, rule: str, message: str, node: Optional[ast.AST] = None, severity: str = "error") -> None:
+        self.diagnostics.append(Diagnostic(
+            rule=rule,
+            message=message,
+            line=getattr(node, "lineno", 0),
+            col=getattr(node, "col_offset", 0),
+            severity=severity,
+        ))
+
+
+NodeRule = Callable[[ast.AST, VerificationContext], None]
+ModuleRule = Callable[[VerificationContext], None]
+
+_NODE_RULES: Dict[Type[ast.AST], List[NodeRule]] = defaultdict(list)
+_MODULE_RULES: List[ModuleRule] = []
+
+
+def node_rule(*node_types: Type[ast.AST]) -> Callable[[NodeRule], NodeRule]:
+    """Register a rule that runs on every node of the given types"""
+    def register(func: NodeRule) -> NodeRule:
+        for node_type in node_types:
+            _NODE_RULES[node_type].append(func)
+        return func
+    return register
+
+
+def module_rule(func: ModuleRule) -> ModuleRule:
+    """Register a rule that runs once after the traversal"""
+    _MODULE_RULES.append(func)
+    return func
+
+
+class _RuleVisitor(ast.NodeVisitor):
+    """Runs every registered rule in one pass over the tree"""
+
+    def __init__(self, context: VerificationContext):
+        self.context = context
+
+    def visit(self, node: ast.AST) -> None:
+        # Iterative pre-order walk; cheaper than recursing through NodeVisitor for large files
+        rules = _NODE_RULES
+        context = self.context
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            checks = rules.get(type(current))
+            if checks:
+                for check in checks:
+                    check(current, context)
+            children = []
+            for field in current._fields:
+                value = getattr(current, field, None)
+                if isinstance(value, ast.AST):
+                    children.append(value)
+                elif isinstance(value, list):
+                    children.extend(item for item in value if isinstance(item, ast.AST))
+            # Reversed so siblings are visited in source order
+            stack.extend(reversed(children))
+
+
+@node_rule(ast.Import)
+def _check_import(node: ast.Import, context: VerificationContext) -> None:
+    for alias in node.names:
+        if alias.name.split(".")[0] in DANGEROUS_MODULES:
+            context.report("dangerous-import", f"Dangerous import detected: {alias.name}", node)
+
+
+@node_rule(ast.ImportFrom)
+def _check_import_from(node: ast.ImportFrom, context: VerificationContext) -> None:
+    module = node.module or ""
+    if module.split(".")[0] in DANGEROUS_MODULES:
+        context.report("dangerous-import", f"Dangerous import detected: {module}", node)
+    if module == "manim" and any(alias.name == "*" for alias in node.names):
+        context.has_manim_import = True
+
+
+@node_rule(ast.Call)
+def _check_call(node: ast.Call, context: VerificationContext) -> None:
+    if isinstance(node.func, ast.Name) and node.func.id in DANGEROUS_CALLS:
+        context.report("dangerous-call", f"Dangerous function call detected: {node.func.id}", node)
+
+
+@node_rule(ast.ClassDef)
+def _collect_scene(node: ast.ClassDef, context: VerificationContext) -> None:
+    for base in node.bases:
+        name = base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "")
+        # Scene, ThreeDScene, MovingCameraScene, ... or a scene defined earlier in the file
+        if name.endswith(SCENE_BASE_SUFFIX) or name in context.scenes:
+            context.scenes.append(node.name)
+            break
+    else:
+        return
+
+    context.scene_bases[node.name] = [
+        base.id for base in node.bases if isinstance(base, ast.Name) and base.id in context.scenes
+    ]
+    if any(isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == "construct"
+           for item in node.body):
+        context.constructs.add(node.name)
+
+
+@module_rule
+def _drop_base_scenes(context: VerificationContext) -> None:
+    """Keep only the scenes that get rendered
+
+    Bases other scenes of the file build on, and classes without a construct()
+    of their own or from a base in the file, produce no video of their own.
+    """
+    subclassed = {base for bases in context.scene_bases.values() for base in bases}
+
+    def has_construct(scene: str) -> bool:
+        return scene in context.constructs or any(has_construct(base) for base in context.scene_bases.get(scene, []))
+
+    context.scenes = [scene for scene in context.scenes if scene not in subclassed and has_construct(scene)]
+
+
+@module_rule
+def _check_manim_import(context: VerificationContext) -> None:
+    if not context.has_manim_import:
+        context.report("missing-manim-import", "Missing 'from manim import *'")
+
+
+@module_rule
+def _check_scene_found(context: VerificationContext) -> None:
+    if not context.scenes:
+        context.report("no-scene", "No Scene class found")
+
 
 def verify_code(code: str) -> Dict:
-    """Verify the generated Manim code using AST and safety checks"""
+    """Verify the generated Manim code using AST and safety checks
 
-    
+    Returns ``is_valid`` and string ``errors`` as before, plus structured
+    ``diagnostics``, the discovered ``scenes`` and the parsed ``tree`` (None on
+    syntax errors) so later stages don't need to parse the code again.
+    """
     result = {
         "is_valid": True,
-        "errors": []
+        "errors": [],
+        "diagnostics": [],
+        "scenes": [],
+        "tree": None
     }
-    
+
     # Basic checks before AST parsing
     if not code.strip():
         result["is_valid"] = False
         result["errors"].append("Empty code")
         return result
-    
-    # Check for required imports
-    if "from manim import *" not in code:
-        result["is_valid"] = False
-        result["errors"].append("Missing 'from manim import *'")
-    
-    # Check for Scene class
-    if "class " not in code or "Scene" not in code:
-        result["is_valid"] = False
-        result["errors"].append("No Scene class found")
-    
+
     try:
-        # Parse the AST
         tree = ast.parse(code)
-        
-        # Check for dangerous constructs
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Import):
-                for alias in node.names:
-                    if alias.name in ["os", "sys", "subprocess"]:
-                        result["is_valid"] = False
-                        result["errors"].append(f"Dangerous import detected: {alias.name}")
-            
-            if isinstance(node, ast.Call):
-                if hasattr(node.func, 'id') and node.func.id in ['eval', 'exec', 'open']:
-                    result["is_valid"] = False
-                    result["errors"].append(f"Dangerous function call detected: {node.func.id}")
-    
     except SyntaxError as e:
+        diagnostic = Diagnostic("syntax-error", f"Syntax error: {e.msg}", e.lineno or 0, e.offset or 0)
         result["is_valid"] = False
-        result["errors"].append(f"Syntax error: {str(e)}")
-    
-    return result
\ No newline at end of file
+        result["diagnostics"].append(diagnostic)
+        result["errors"].append(str(diagnostic))
+        return result
+
+    context = VerificationContext()
+    _RuleVisitor(context).visit(tree)
+    for check in _MODULE_RULES:
+        check(context)
+
+    result["tree"] = tree
+    result["scenes"] = context.scenes
+    result["diagnostics"] = context.diagnostics
+    result["errors"] = [str(d) for d in context.diagnostics if d.severity == "error"]
+    result["is_valid"] = not result["errors"]
+    return result
+
+
+def find_scene_classes(code: str) -> List[str]:
+    """Names of all Scene subclasses in the code, in definition order"""
+    return verify_code(code)["scenes"]
@@ -0,0 +1,77 @@
+import re
+from typing import Optional
+
+DANGEROUS_MODULES = ["os", "sys", "subprocess"]
+DANGEROUS_CALLS = ["eval", "exec", "open", "__import__"]
+REQUIRED_HEADER = "from manim import *"
+
+_IMPORT_RE = re.compile(r"^\s*(?:import\s+(?P<modules>[\w.,\s]+?)(?:\s+as\s+\w+)?\s*$|from\s+(?P<module>[\w.]+)\s+import\b)")
+# Any form of the header: spacing, a trailing comment or a parenthesized name list
+_MANIM_IMPORT_RE = re.compile(r"^\s*from\s+manim\s+import\b")
+_STRING_RE = re.compile(r"^[rRbBuUfF]{0,2}['\"]")
+
+
+def check_line(line: str) -> Optional[str]:
+    """Return an error if a single complete line of code is unsafe"""
+    match = _IMPORT_RE.match(line)
+    if match is None:
+        if "__import__(" in line:
+            return "Dangerous function call detected: __import__"
+        return None
+
+    if match.group("module"):
+        modules = [match.group("module")]
+    else:
+        modules = [name.strip().split(" ")[0] for name in match.group("modules").split(",")]
+    for module in modules:
+        if module.split(".")[0] in DANGEROUS_MODULES:
+            return f"Dangerous import detected: {module}"
+    return None
+
+
+def _opened_triple_quote(line: str) -> Optional[str]:
+    """The triple quote a line leaves open, e.g. the first line of a multi-line docstring"""
+    for quote in ('"""', "'''"):
+        if line.count(quote) % 2 == 1:
+            return quote
+    return None
+
+
+class StreamingCodeChecker:
+    """Checks code line by line while it is still being generated"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.header_seen = False
+        self._open_quote: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        """Add streamed text and return an error as soon as a completed line is invalid"""
+        self.buffer += text
+        while self.error is None and "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            self.error = self._check_complete_line(line)
+        return self.error
+
+    def _check_complete_line(self, line: str) -> Optional[str]:
+        stripped = line.strip()
+        if self._open_quote is not None:
+            # Inside a multi-line string; its text isn't code
+            if self._open_quote in stripped:
+                self._open_quote = None
+            return None
+        if not stripped or stripped.startswith("#"):
+            return None
+        self._open_quote = _opened_triple_quote(stripped)
+
+        error = check_line(line)
+        if error:
+            return error
+
+        if _MANIM_IMPORT_RE.match(line):
+            self.header_seen = True
+        elif not self.header_seen and not _IMPORT_RE.match(line) and not _STRING_RE.match(stripped):
+            # Only docstrings and other imports may come before the manim header
+            return f"Missing '{REQUIRED_HEADER}'"
+        return None